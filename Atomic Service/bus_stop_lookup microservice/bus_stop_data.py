@@ -0,0 +1,178 @@
+# bus_stop_data.py
+# Shared helpers for the LTA bus stop dataset (bus_stops.csv) and its Redis representation
+import csv
+import hashlib
+import json
+import os
+import time
+import uuid
+import redis
+
+BUS_STOPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bus_stops.csv")
+
+BUS_STOPS_KEY = "bus_stops"
+BUS_STOPS_VERSION_KEY = "bus_stops:version"
+BUS_STOPS_GEO_KEY = "bus_stops:geo"
+BUS_STOPS_HASH_KEY = "bus_stops:hash"
+BUS_STOPS_STAGING_KEY = "bus_stops:staging"
+BUS_STOPS_GEO_STAGING_KEY = "bus_stops:geo:staging"
+BUS_STOPS_LOCK_KEY = "bus_stops:load_lock"
+
+# Stops per pipeline round trip during bulk loads
+DEFAULT_CHUNK_SIZE = int(os.getenv("BUS_STOPS_CHUNK_SIZE", 500))
+# Only one loader writes at a time (replicas and workers all load at start-up); the lock
+# and any abandoned staging keys expire after BUS_STOPS_LOCK_TTL seconds
+BUS_STOPS_LOCK_TTL = int(os.getenv("BUS_STOPS_LOCK_TTL", 300))
+BUS_STOPS_LOCK_WAIT = float(os.getenv("BUS_STOPS_LOCK_WAIT", 60))
+
+def read_bus_stops(path=BUS_STOPS_FILE):
+    """Read the stop dataset into the same list of dicts the LTA BusStops API returns"""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        return [
+            {
+                "BusStopCode": code,
+                "RoadName": road_name,
+                "Description": description,
+                "Latitude": float(latitude),
+                "Longitude": float(longitude)
+            }
+            for code, road_name, description, latitude, longitude in reader
+        ]
+
+def bus_stops_payload(stops):
+    return json.dumps({"value": stops})
+
+def bus_stops_checksum(stops):
+    return hashlib.sha256(bus_stops_payload(stops).encode("utf-8")).hexdigest()
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+def is_loaded(client, checksum, geo=False):
+    """True when Redis already holds this exact dataset (and the GEO set, in geo mode)"""
+    if not client.exists(BUS_STOPS_KEY) or (geo and not client.exists(BUS_STOPS_GEO_KEY)):
+        return False
+    return client.get(BUS_STOPS_HASH_KEY) == checksum
+
+def acquire_load_lock(client, wait=BUS_STOPS_LOCK_WAIT, log=print):
+    """Take the loader lock, waiting up to wait seconds for another loader. Returns its token."""
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not client.set(BUS_STOPS_LOCK_KEY, token, nx=True, ex=BUS_STOPS_LOCK_TTL):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Another loader still holds {BUS_STOPS_LOCK_KEY} after {wait:.0f}s")
+        log("Another loader is writing bus stops, waiting...")
+        time.sleep(0.5)
+    return token
+
+def release_load_lock(client, token):
+    """Delete the lock only if this loader still owns it"""
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(BUS_STOPS_LOCK_KEY)
+            if pipe.get(BUS_STOPS_LOCK_KEY) == token:
+                pipe.multi()
+                pipe.delete(BUS_STOPS_LOCK_KEY)
+                pipe.execute()
+        except redis.WatchError:
+            pass
+
+def bulk_load_bus_stops(client, stops, geo=False, chunk_size=DEFAULT_CHUNK_SIZE, force=False, log=print):
+    """
+    Stream the stop list into Redis in chunks through non-transactional pipelines,
+    so no single command blocks the shared server for long. The bus_stops value
+    (and GEO set) are built under staging keys private to this run and swapped in
+    with RENAME at the end, together with the content hash and a version bump.
+    Concurrent loaders are serialized by a lock in Redis.
+
+    Skips all writes when the stored dataset has the same content hash, unless force is set.
+    Returns a summary dict with status, version, checksum, count and timing.
+    """
+    checksum = bus_stops_checksum(stops)
+    if not force and is_loaded(client, checksum, geo):
+        log(f"Bus stops unchanged (sha256 {checksum[:12]}), skipping load")
+        return {"status": "skipped", "version": client.get(BUS_STOPS_VERSION_KEY),
+                "checksum": checksum, "count": len(stops), "seconds": 0.0}
+
+    token = acquire_load_lock(client, log=log)
+    try:
+        # Another loader may have written the same data while we waited
+        if not force and is_loaded(client, checksum, geo):
+            log(f"Bus stops loaded by another loader (sha256 {checksum[:12]}), skipping load")
+            return {"status": "skipped", "version": client.get(BUS_STOPS_VERSION_KEY),
+                    "checksum": checksum, "count": len(stops), "seconds": 0.0}
+        return _write_bus_stops(client, stops, checksum, geo, chunk_size, token, log)
+    finally:
+        release_load_lock(client, token)
+
+def _write_bus_stops(client, stops, checksum, geo, chunk_size, token, log):
+    start_time = time.perf_counter()
+    staging_key = f"{BUS_STOPS_STAGING_KEY}:{token}"
+    geo_staging_key = f"{BUS_STOPS_GEO_STAGING_KEY}:{token}"
+
+    written_bytes = 0
+    for offset, chunk in _chunks(stops, chunk_size):
+        # Pieces concatenate to exactly bus_stops_payload(stops)
+        piece = ", ".join(json.dumps(stop) for stop in chunk)
+        if offset == 0:
+            piece = '{"value": [' + piece
+        if offset + len(chunk) >= len(stops):
+            piece += "]}"
+        else:
+            piece += ", "
+
+        pipe = client.pipeline(transaction=False)
+        pipe.append(staging_key, piece)
+        pipe.expire(staging_key, BUS_STOPS_LOCK_TTL)
+        if geo:
+            pipe.geoadd(geo_staging_key,
+                        [value for stop in chunk for value in (stop["Longitude"], stop["Latitude"], stop["BusStopCode"])])
+            for stop in chunk:
+                pipe.hset(f"bus_stop:{stop['BusStopCode']}", mapping={
+                    "RoadName": stop["RoadName"],
+                    "Description": stop["Description"],
+                    "Latitude": stop["Latitude"],
+                    "Longitude": stop["Longitude"]
+                })
+        if geo:
+            pipe.expire(geo_staging_key, BUS_STOPS_LOCK_TTL)
+        pipe.execute()
+
+        written_bytes += len(piece.encode("utf-8"))
+        log(f"  {offset + len(chunk)}/{len(stops)} stops written ({written_bytes / 1024:.0f} KB)")
+
+    if not stops:
+        client.set(staging_key, bus_stops_payload(stops), ex=BUS_STOPS_LOCK_TTL)
+
+    # Never publish a value that does not parse or does not match the hash about to be stored
+    staged = client.get(staging_key)
+    try:
+        json.loads(staged or "")
+        valid = hashlib.sha256(staged.encode("utf-8")).hexdigest() == checksum
+    except ValueError:
+        valid = False
+    if not valid:
+        client.delete(staging_key, geo_staging_key)
+        raise ValueError(f"Staged bus stops under {staging_key} are corrupt, not publishing them")
+
+    # Swap the staged data in atomically with its hash and a new version
+    # (PERSIST first: RENAME would carry the staging expiry over)
+    pipe = client.pipeline()
+    pipe.persist(staging_key)
+    pipe.rename(staging_key, BUS_STOPS_KEY)
+    if geo and stops:
+        pipe.persist(geo_staging_key)
+        pipe.rename(geo_staging_key, BUS_STOPS_GEO_KEY)
+    pipe.set(BUS_STOPS_HASH_KEY, checksum)
+    pipe.incr(BUS_STOPS_VERSION_KEY)
+    version = pipe.execute()[-1]
+
+    seconds = time.perf_counter() - start_time
+    log(f"Loaded {len(stops)} stops in {seconds:.3f}s "
+        f"({len(stops) / max(seconds, 1e-9):.0f} stops/s, {written_bytes / 1024 / 1024 / max(seconds, 1e-9):.1f} MB/s), "
+        f"version {version}")
+    return {"status": "loaded", "version": version, "checksum": checksum,
+            "count": len(stops), "seconds": round(seconds, 3)}
@@ -3,11 +3,18 @@
 import redis
 import json
 import time
+import threading
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 import os
 import math
+import re
+import bisect
+import difflib
+import numpy as np
 from flasgger import Swagger, swag_from
 from flask_cors import CORS
+from bus_stop_data import read_bus_stops, bulk_load_bus_stops, BUS_STOPS_KEY, BUS_STOPS_VERSION_KEY, BUS_STOPS_GEO_KEY
 
 app = Flask(__name__)
 CORS(app)
@@ -52,25 +59,30 @@ redis_host = os.getenv("REDIS_HOST", "redis")
 redis_port = int(os.getenv("REDIS_PORT", 6379))
 client = redis.Redis(host=redis_host, port=redis_port, decode_responses=True)
 
-# Sample Bus Stop Data
-bus_stops = {
-    "value": [
-        {
-            "BusStopCode": "01012",
-            "RoadName": "Victoria St",
-            "Description": "Hotel Grand Pacific",
-            "Latitude": 1.29684825487647,
-            "Longitude": 103.85253591654006
-        },
-        {
-            "BusStopCode": "01013",
-            "RoadName": "Victoria St",
-            "Description": "St. Joseph's Ch",
-            "Latitude": 1.29770970610083,
-            "Longitude": 103.8532247463225
-        }
-    ]
-}
+EARTH_RADIUS_KM = 6371
+# Grid cell size for the nearest-stop index (stops are typically 200-400 m apart)
+GRID_CELL_KM = float(os.getenv("GRID_CELL_KM", 0.5))
+
+# The loaders bump BUS_STOPS_VERSION_KEY whenever the "bus_stops" value is rewritten
+VERSION_CHECK_INTERVAL = float(os.getenv("VERSION_CHECK_INTERVAL", 5))
+
+# "blob": nearest stop from the in-process grid index over the bus_stops value
+# "geo": nearest stop from GEOSEARCH on the shared bus_stops:geo set
+BUS_STOP_STORE = os.getenv("BUS_STOP_STORE", "blob").lower()
+GEO_SEARCH_RADIUS_KM = float(os.getenv("GEO_SEARCH_RADIUS_KM", 50))
+
+# Batch lookups: maximum points per request and queries per vectorized chunk
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10000))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 256))
+
+# Nearest-stop memo: coordinates rounded to 5 decimals (~1 m), bounded LRU with TTL
+NEAREST_CACHE_SIZE = int(os.getenv("NEAREST_CACHE_SIZE", 50000))
+NEAREST_CACHE_TTL = float(os.getenv("NEAREST_CACHE_TTL", 3600))
+COORD_PRECISION = 5
+
+# Stop name search: default/maximum results per query
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
 
 # Wait for Redis to be ready
 def wait_for_redis():
@@ -96,31 +108,364 @@ def wait_for_redis():
 
 # Auto-load Bus Stops into Redis
 def load_bus_stops():
-    if not client.exists("bus_stops"):  # Only load if empty
+    missing_geo = BUS_STOP_STORE == "geo" and not client.exists(BUS_STOPS_GEO_KEY)
+    if not client.exists(BUS_STOPS_KEY) or missing_geo:  # Only load if empty
         print("🔄 Loading bus stops into Redis...")
-        client.set("bus_stops", json.dumps(bus_stops))
-        print("✅ Bus stops loaded!")
+        summary = bulk_load_bus_stops(client, read_bus_stops(), geo=(BUS_STOP_STORE == "geo"))
+        if summary["status"] == "loaded":
+            print(f"✅ Bus stops loaded (version {summary['version']})!")
+        else:
+            print(f"✅ Bus stops already in Redis, written by another loader (version {summary['version']})")
     else:
         print("✅ Bus stops already exist in Redis.")
 
 def haversine(lat1, lon1, lat2, lon2):
-    R = 6371
+    R = EARTH_RADIUS_KM
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
     a = math.sin(dlat/2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2) ** 2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
 
-def find_nearest_bus_stop(lat, lng):
-    stored_bus_stops = json.loads(client.get("bus_stops"))
-    lta_bus_stops = stored_bus_stops["value"]
-    
-    if not lta_bus_stops:
-        print("No bus stops available for search.")
+class NearestStopCache:
+    """Bounded LRU with per-entry TTL, keyed by quantized (lat, lng)"""
+    def __init__(self, max_size=NEAREST_CACHE_SIZE, ttl=NEAREST_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(lat, lng):
+        return (round(lat, COORD_PRECISION), round(lng, COORD_PRECISION))
+
+    def get(self, lat, lng):
+        key = self.key(lat, lng)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, lat, lng, stop):
+        if self.max_size <= 0:
+            return
+        key = self.key(lat, lng)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), stop)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+nearest_stop_cache = NearestStopCache()
+
+class BusStopGrid:
+    """
+    Uniform grid over equirectangular-projected stop coordinates.
+    Nearest-stop queries scan rings of cells around the query point and
+    re-rank the few candidates with the exact haversine distance.
+    """
+    def __init__(self, stops, cell_km=GRID_CELL_KM):
+        self.stops = stops
+        self.cell_km = cell_km
+        self.cells = {}
+
+        ref_lat = sum(stop["Latitude"] for stop in stops) / len(stops) if stops else 0.0
+        self.km_per_deg_lat = EARTH_RADIUS_KM * math.pi / 180
+        self.km_per_deg_lng = self.km_per_deg_lat * math.cos(math.radians(ref_lat))
+
+        for i, stop in enumerate(stops):
+            self.cells.setdefault(self._cell(stop["Latitude"], stop["Longitude"]), []).append(i)
+
+        # Array-backed coordinates for vectorized batch queries
+        self.lat_rad = np.radians(np.array([stop["Latitude"] for stop in stops], dtype=float))
+        self.lng_rad = np.radians(np.array([stop["Longitude"] for stop in stops], dtype=float))
+        self.cos_lat = np.cos(self.lat_rad)
+
+        xs = [cell[0] for cell in self.cells] or [0]
+        ys = [cell[1] for cell in self.cells] or [0]
+        self.min_x, self.max_x = min(xs), max(xs)
+        self.min_y, self.max_y = min(ys), max(ys)
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lng * self.km_per_deg_lng / self.cell_km)),
+                int(math.floor(lat * self.km_per_deg_lat / self.cell_km)))
+
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def _linear_nearest(self, lat, lng):
+        return min(self.stops, key=lambda stop: haversine(lat, lng, stop["Latitude"], stop["Longitude"]))
+
+    def nearest(self, lat, lng):
+        if not self.stops:
+            return None
+
+        cx, cy = self._cell(lat, lng)
+        # Far outside the stop coverage the ring scan degenerates; a plain scan is cheaper
+        if not (self.min_x - 1 <= cx <= self.max_x + 1 and self.min_y - 1 <= cy <= self.max_y + 1):
+            return self._linear_nearest(lat, lng)
+
+        max_ring = max(cx - self.min_x, self.max_x - cx, cy - self.min_y, self.max_y - cy)
+        best_stop, best_km = None, float("inf")
+        for r in range(max_ring + 1):
+            # Every stop in ring r is at least (r - 1) cells away; 1% slack covers projection error
+            if best_stop is not None and (r - 1) * self.cell_km > best_km * 1.01:
+                break
+            for cell in self._ring(cx, cy, r):
+                for i in self.cells.get(cell, ()):
+                    stop = self.stops[i]
+                    distance = haversine(lat, lng, stop["Latitude"], stop["Longitude"])
+                    if distance < best_km:
+                        best_stop, best_km = stop, distance
+        return best_stop
+
+    def nearest_many(self, lats, lngs, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        Vectorized haversine nearest stop for many points.
+        Returns (stop indices, distances in km) as NumPy arrays.
+        """
+        q_lat = np.radians(np.asarray(lats, dtype=float))
+        q_lng = np.radians(np.asarray(lngs, dtype=float))
+        indices = np.empty(len(q_lat), dtype=np.int64)
+        distances = np.empty(len(q_lat), dtype=float)
+
+        # Chunk the queries so the (queries x stops) matrix stays a few MB
+        for start in range(0, len(q_lat), chunk_size):
+            lat = q_lat[start:start + chunk_size, None]
+            lng = q_lng[start:start + chunk_size, None]
+            a = (np.sin((self.lat_rad - lat) / 2) ** 2
+                 + np.cos(lat) * self.cos_lat * np.sin((self.lng_rad - lng) / 2) ** 2)
+            best = a.argmin(axis=1)
+            best_a = a[np.arange(len(best)), best]
+            indices[start:start + len(best)] = best
+            distances[start:start + len(best)] = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(best_a, 0, 1)))
+        return indices, distances
+
+def normalize_search_text(text):
+    """Lowercase, drop punctuation (S'pore -> spore) and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9 ]", "", (text or "").lower()).split())
+
+class BusStopSearchIndex:
+    """
+    Hash index by BusStopCode plus a sorted list of (term, rank, stop index) for
+    prefix search. Terms are every word-boundary suffix of Description and RoadName
+    ("opp pasir ris stn", "pasir ris stn", ...) and the stop code itself, so a
+    prefix can start at any word. Lower rank means a better match.
+    """
+    RANK_CODE = 0
+    RANK_DESCRIPTION = 1
+    RANK_ROAD_NAME = 2
+    RANK_INNER_WORD = 3
+
+    def __init__(self, stops):
+        self.stops = stops
+        self.by_code = {stop["BusStopCode"]: stop for stop in stops}
+
+        terms = []
+        self.descriptions = {}
+        for i, stop in enumerate(stops):
+            terms.append((stop["BusStopCode"], self.RANK_CODE, i))
+            for field, rank in (("Description", self.RANK_DESCRIPTION), ("RoadName", self.RANK_ROAD_NAME)):
+                words = normalize_search_text(stop[field]).split()
+                for w in range(len(words)):
+                    terms.append((" ".join(words[w:]), rank if w == 0 else self.RANK_INNER_WORD, i))
+            self.descriptions.setdefault(normalize_search_text(stop["Description"]), []).append(i)
+        terms.sort()
+        self.terms = terms
+        self.keys = [term for term, _, _ in terms]
+
+    def get(self, code):
+        return self.by_code.get(code)
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT, fuzzy=True):
+        query = normalize_search_text(query)
+        if not query:
+            return []
+
+        best_rank = {}
+        start = bisect.bisect_left(self.keys, query)
+        for term, rank, i in self.terms[start:]:
+            if not term.startswith(query):
+                break
+            if rank < best_rank.get(i, rank + 1):
+                best_rank[i] = rank
+
+        ranked = sorted(best_rank, key=lambda i: (best_rank[i], self.stops[i]["Description"], self.stops[i]["BusStopCode"]))
+        results = [self.stops[i] for i in ranked[:limit]]
+
+        # Fall back to close matches on the description for typos ("tampnes" -> "tampines")
+        if fuzzy and not results:
+            for description in difflib.get_close_matches(query, self.descriptions, n=limit, cutoff=0.6):
+                results.extend(self.stops[i] for i in self.descriptions[description])
+            results = results[:limit]
+        return results
+
+class IndexNotReady(Exception):
+    """The stop table has not been loaded into Redis yet"""
+
+# Version of the stop data in Redis, read at most every VERSION_CHECK_INTERVAL seconds.
+# The nearest-stop memo belongs to one version and is cleared when it changes (both stores).
+data_version = None
+last_version_check = None
+version_lock = threading.Lock()
+
+def check_data_version():
+    global data_version, last_version_check
+    now = time.monotonic()
+    if last_version_check is not None and now - last_version_check < VERSION_CHECK_INTERVAL:
+        return data_version
+
+    with version_lock:
+        if last_version_check is not None and now - last_version_check < VERSION_CHECK_INTERVAL:
+            return data_version
+        version = client.get(BUS_STOPS_VERSION_KEY)
+        last_version_check = now
+        if version != data_version:
+            nearest_stop_cache.clear()
+            data_version = version
+    return data_version
+
+# Decoded copy of the stop table and its spatial index, rebuilt when the data version changes
+stop_index = None
+stop_search_index = None
+stop_index_version = None
+stop_index_lock = threading.Lock()
+
+def get_stop_index():
+    global stop_index, stop_search_index, stop_index_version
+    version = check_data_version()
+    if stop_index is not None and version == stop_index_version:
+        return stop_index
+
+    with stop_index_lock:
+        if stop_index is None or version != stop_index_version:
+            data = client.get(BUS_STOPS_KEY)
+            if data is None:
+                raise IndexNotReady("No bus_stops data in Redis yet")
+            stored_bus_stops = json.loads(data)
+            lta_bus_stops = stored_bus_stops["value"]
+            grid, search_index = BusStopGrid(lta_bus_stops), BusStopSearchIndex(lta_bus_stops)
+            stop_index, stop_search_index = grid, search_index
+            stop_index_version = version
+            print(f"✅ Built bus stop grid index (version {version}): {len(lta_bus_stops)} stops in {len(stop_index.cells)} cells")
+    return stop_index
+
+def get_stop_search_index():
+    get_stop_index()
+    return stop_search_index
+
+def find_nearest_bus_stop_geo(lat, lng):
+    matches = client.geosearch(BUS_STOPS_GEO_KEY, longitude=lng, latitude=lat,
+                               radius=GEO_SEARCH_RADIUS_KM, unit="km", sort="ASC", count=1)
+    if not matches:
+        print(f"No bus stop within {GEO_SEARCH_RADIUS_KM} km of ({lat}, {lng}).")
         return None
-    nearest_stop = min(lta_bus_stops, key=lambda stop: haversine(lat, lng, stop["Latitude"], stop["Longitude"]))
+
+    code = matches[0]
+    details = client.hgetall(f"bus_stop:{code}")
+    return {
+        "BusStopCode": code,
+        "RoadName": details.get("RoadName"),
+        "Description": details.get("Description"),
+        "Latitude": float(details["Latitude"]) if "Latitude" in details else None,
+        "Longitude": float(details["Longitude"]) if "Longitude" in details else None
+    }
+
+def find_nearest_bus_stop(lat, lng):
+    check_data_version()
+    cached = nearest_stop_cache.get(lat, lng)
+    if cached is not None:
+        return cached
+
+    if BUS_STOP_STORE == "geo":
+        nearest_stop = find_nearest_bus_stop_geo(lat, lng)
+    else:
+        index = get_stop_index()
+        
+        if not index.stops:
+            print("No bus stops available for search.")
+            return None
+        nearest_stop = index.nearest(lat, lng)
+
+    if nearest_stop is not None:
+        nearest_stop_cache.put(lat, lng, nearest_stop)
     return nearest_stop
 
+def find_nearest_bus_stops_batch(coordinates):
+    """Nearest stop for each (lat, lng) pair, always served from the in-memory stop table"""
+    if not coordinates:
+        return []
+    index = get_stop_index()
+    if not index.stops:
+        return [None] * len(coordinates)
+
+    results = [None] * len(coordinates)
+    misses = []
+    for i, (lat, lng) in enumerate(coordinates):
+        cached = nearest_stop_cache.get(lat, lng)
+        if cached is not None:
+            results[i] = (cached, haversine(lat, lng, cached["Latitude"], cached["Longitude"]))
+        else:
+            misses.append(i)
+
+    if misses:
+        lats = [coordinates[i][0] for i in misses]
+        lngs = [coordinates[i][1] for i in misses]
+        indices, distances = index.nearest_many(lats, lngs)
+        for i, stop_i, distance in zip(misses, indices, distances):
+            stop = index.stops[stop_i]
+            nearest_stop_cache.put(coordinates[i][0], coordinates[i][1], stop)
+            results[i] = (stop, float(distance))
+    return results
+
+def parse_coordinate(item):
+    """Accepts {"lat": .., "lng": ..} (Google location format) or a [lat, lng] pair"""
+    if isinstance(item, dict):
+        lat, lng = item.get("lat"), item.get("lng")
+    elif isinstance(item, (list, tuple)) and len(item) == 2:
+        lat, lng = item
+    else:
+        raise ValueError(f"Invalid coordinate: {item}")
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"Coordinate out of range: {item}")
+    return lat, lng
+
 def extract_first_transit_details(routes):
     extracted_details = []
     
@@ -151,19 +496,145 @@ def extract_first_transit_details(routes):
     
     return extracted_details
 
-# Wait for Redis & Load Data
-wait_for_redis()
-load_bus_stops()
+def extract_all_transit_details(routes):
+    """
+    Every transit step of every route, with boarding and alighting stops for bus legs.
+    All bus stop coordinates are resolved in one batched lookup.
+    """
+    transit_steps = []
+    coordinates = []
+
+    for route_index, route in enumerate(routes):
+        for leg in route.get("legs", []):
+            for step in leg.get("steps", []):
+                if "transit_details" not in step or step.get("travel_mode", "").lower() != "transit":
+                    continue
+                transit = step["transit_details"]
+                is_bus = transit["line"].get("vehicle", {}).get("type", "").lower() == "bus"
+                if is_bus:
+                    for stop_key in ("departure_stop", "arrival_stop"):
+                        location = transit[stop_key]["location"]
+                        coordinates.append((location["lat"], location["lng"]))
+                transit_steps.append((route_index, transit, is_bus))
+
+    nearest_stops = iter(find_nearest_bus_stops_batch(coordinates))
+
+    extracted_details = []
+    for route_index, transit, is_bus in transit_steps:
+        transport = {"RouteIndex": route_index}
+        line_name = transit["line"]["name"]
+
+        if is_bus:
+            boarding, alighting = next(nearest_stops), next(nearest_stops)
+            transport["BusStopCode"] = boarding[0]["BusStopCode"] if boarding else "Unknown"
+            transport["Description"] = transit["departure_stop"]["name"]
+            transport["AlightingBusStopCode"] = alighting[0]["BusStopCode"] if alighting else "Unknown"
+            transport["AlightingDescription"] = transit["arrival_stop"]["name"]
+            transport["BusNumber"] = line_name
+        else:
+            transport["TrainLine"] = line_name
+            transport["Description"] = transit.get("departure_stop", {}).get("name")
+            transport["AlightingDescription"] = transit.get("arrival_stop", {}).get("name")
+
+        extracted_details.append(transport)
+
+    return extracted_details
+
+# Wait for Redis, load data and build the indexes in the background, so importing
+# this module (gunicorn workers, tests) never blocks. /ready reports the state.
+warmup_state = {"status": "pending", "error": None, "started_at": None, "ready_at": None}
+warmup_lock = threading.Lock()
+
+def warm_up():
+    try:
+        wait_for_redis()
+        load_bus_stops()
+        if BUS_STOP_STORE == "geo":
+            # Single lookups run on the shared GEO set; the local stop table is only
+            # built if a batch, legs=all or search request needs it
+            if not client.exists(BUS_STOPS_GEO_KEY):
+                raise IndexNotReady(f"No {BUS_STOPS_GEO_KEY} set in Redis yet")
+            check_data_version()
+        else:
+            get_stop_index()
+        warmup_state["status"] = "ready"
+        warmup_state["ready_at"] = time.time()
+        print(f"✅ Bus stop lookup ready in {warmup_state['ready_at'] - warmup_state['started_at']:.2f}s")
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        warmup_state["error"] = str(e)
+        print(f"❌ Warm-up failed: {str(e)}")
+
+def start_warmup():
+    """Start the warm-up thread once; a failed warm-up is retried on the next request"""
+    if warmup_state["status"] in ("warming", "ready"):
+        return
+    with warmup_lock:
+        if warmup_state["status"] in ("warming", "ready"):
+            return
+        warmup_state.update({"status": "warming", "error": None, "started_at": time.time()})
+        threading.Thread(target=warm_up, name="bus-stop-warmup", daemon=True).start()
+
+@app.before_request
+def ensure_warmup():
+    start_warmup()
+
+@app.errorhandler(IndexNotReady)
+def index_not_ready(e):
+    return jsonify({"error": "Bus stop index is not ready", "details": str(e), "status": warmup_state["status"]}), 503
+
+@app.errorhandler(redis.RedisError)
+def redis_unavailable(e):
+    return jsonify({"error": "Bus stop data store is unavailable", "details": str(e), "status": warmup_state["status"]}), 503
 
 @app.route("/")
 def notify():
     return "<h1>Hey visit http://localhost:5002/apidocs></a> for api docs</h1>"
 
+@app.route("/health", methods=["GET"])
+def health():
+    """Liveness: the process is up, whatever the index state"""
+    return jsonify({"status": "ok"})
+
+@app.route("/ready", methods=["GET"])
+@swag_from({
+    "summary": "Readiness of the bus stop index",
+    "tags": ["Health"],
+    "responses": {
+        "200": {
+            "description": "Redis is reachable and the stop data is ready: the local index is built (blob) or the GEO set exists (geo)"
+        },
+        "503": {
+            "description": "Still warming up, or warm-up failed (see error)"
+        }
+    }
+})
+def ready():
+    body = {
+        **warmup_state,
+        "store": BUS_STOP_STORE,
+        "data_version": data_version,
+        "index": {
+            "version": stop_index_version,
+            "stops": len(stop_index.stops) if stop_index is not None else 0
+        }
+    }
+    return jsonify(body), 200 if warmup_state["status"] == "ready" else 503
+
 @app.route("/bus_stop_lookup", methods=["POST"])
 @swag_from({
     "summary": "Find nearest bus stop from Google Directions API (Note: It takes the entire JSON response))",
     "tags": ["Bus Stops"],
     "parameters": [
+        {
+            "name": "legs",
+            "in": "query",
+            "type": "string",
+            "enum": ["first", "all"],
+            "default": "first",
+            "required": False,
+            "description": "'first' returns the first transit step per route leg; 'all' returns every transit leg with boarding and alighting stops (matched on the in-process stop table, which geo mode builds on first use)"
+        },
         {
             "name": "body",
             "in": "body",
@@ -192,11 +663,185 @@ def bus_stop_lookup():
     data = request.get_json()
     routes = data.get("routes", [])
 
-    transit_details = extract_first_transit_details(routes)
+    if request.args.get("legs", "first").lower() == "all":
+        transit_details = extract_all_transit_details(routes)
+    else:
+        transit_details = extract_first_transit_details(routes)
     
     if not transit_details:
         return jsonify({"message": "No public transport steps found", "transit_details": []}), 200
     
     return jsonify({"transit_details": transit_details})
+
+@app.route("/bus_stop_lookup/batch", methods=["POST"])
+@swag_from({
+    "summary": "Find the nearest bus stop for many coordinates at once",
+    "description": "Served from the in-process stop table in both stores; with BUS_STOP_STORE=geo the table is loaded from Redis on the first batch request.",
+    "tags": ["Bus Stops"],
+    "parameters": [
+        {
+            "name": "body",
+            "in": "body",
+            "required": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "coordinates": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "lat": {"type": "number"},
+                                "lng": {"type": "number"}
+                            }
+                        },
+                        "description": "Points as {lat, lng} objects or [lat, lng] pairs"
+                    }
+                }
+            }
+        }
+    ],
+    "responses": {
+        "200": {
+            "description": "Nearest bus stop and distance (km) for each coordinate, in request order"
+        },
+        "400": {
+            "description": "Missing, invalid or too many coordinates"
+        }
+    }
+})
+def bus_stop_lookup_batch():
+    data = request.get_json(silent=True) or {}
+    items = data.get("coordinates")
+
+    if not isinstance(items, list):
+        return jsonify({"error": "Missing coordinates array in request body"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Too many coordinates ({len(items)}), maximum is {MAX_BATCH_SIZE}"}), 400
+
+    try:
+        coordinates = [parse_coordinate(item) for item in items]
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = []
+    for (lat, lng), match in zip(coordinates, find_nearest_bus_stops_batch(coordinates)):
+        result = {"lat": lat, "lng": lng}
+        if match:
+            stop, distance = match
+            result.update({
+                "BusStopCode": stop["BusStopCode"],
+                "RoadName": stop["RoadName"],
+                "Description": stop["Description"],
+                "DistanceKm": round(distance, 4)
+            })
+        else:
+            result["BusStopCode"] = "Unknown"
+        results.append(result)
+
+    return jsonify({"results": results})
+
+@app.route("/bus_stop_lookup/stats", methods=["GET"])
+@swag_from({
+    "summary": "Nearest-stop cache counters and stop index state",
+    "tags": ["Bus Stops"],
+    "responses": {
+        "200": {
+            "description": "Cache size, hits, misses, evictions and hit rate, plus index version and stop count"
+        }
+    }
+})
+def bus_stop_lookup_stats():
+    return jsonify({
+        "store": BUS_STOP_STORE,
+        "index": {
+            "version": stop_index_version,
+            "stops": len(stop_index.stops) if stop_index is not None else 0
+        },
+        "nearest_stop_cache": nearest_stop_cache.stats()
+    })
+
+@app.route("/bus_stops/search", methods=["GET"])
+@swag_from({
+    "summary": "Prefix search on bus stop Description, RoadName or BusStopCode (for autocomplete)",
+    "description": "Searches the in-process stop table; with BUS_STOP_STORE=geo it is loaded from Redis on first use.",
+    "tags": ["Bus Stops"],
+    "parameters": [
+        {
+            "name": "q",
+            "in": "query",
+            "type": "string",
+            "required": True,
+            "description": "Search text, matched as a prefix of any word in the stop name or road name"
+        },
+        {
+            "name": "limit",
+            "in": "query",
+            "type": "integer",
+            "required": False,
+            "default": SEARCH_DEFAULT_LIMIT,
+            "description": f"Maximum results (up to {SEARCH_MAX_LIMIT})"
+        },
+        {
+            "name": "fuzzy",
+            "in": "query",
+            "type": "string",
+            "required": False,
+            "default": "true",
+            "description": "Fall back to close description matches when no prefix matches"
+        }
+    ],
+    "responses": {
+        "200": {
+            "description": "Matching bus stops, best matches first"
+        },
+        "400": {
+            "description": "Missing q or invalid limit"
+        }
+    }
+})
+def search_bus_stops():
+    query = request.args.get("q", "")
+    if not query.strip():
+        return jsonify({"error": "Missing q parameter"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    fuzzy = request.args.get("fuzzy", "true").lower() == "true"
+
+    results = get_stop_search_index().search(query, limit=limit, fuzzy=fuzzy)
+    return jsonify({"query": query, "results": results})
+
+@app.route("/bus_stops/<code>", methods=["GET"])
+@swag_from({
+    "summary": "Get a bus stop by its BusStopCode",
+    "description": "Looked up in the in-process stop table; with BUS_STOP_STORE=geo it is loaded from Redis on first use.",
+    "tags": ["Bus Stops"],
+    "parameters": [
+        {
+            "name": "code",
+            "in": "path",
+            "type": "string",
+            "required": True,
+            "description": "LTA Bus Stop Code, e.g. 01012"
+        }
+    ],
+    "responses": {
+        "200": {
+            "description": "Bus stop details"
+        },
+        "404": {
+            "description": "Bus stop not found"
+        }
+    }
+})
+def get_bus_stop(code):
+    stop = get_stop_search_index().get(code)
+    if stop is None:
+        return jsonify({"error": f"Bus stop {code} not found"}), 404
+    return jsonify(stop)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5002, debug=True)
\ No newline at end of file
+    start_warmup()
+    app.run(host="0.0.0.0", port=5002, debug=True)
@@ -1,74 +1,551 @@
-from flask import Flask, request, jsonify
-from flasgger import Swagger
-from flask_cors import CORS
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
 from pathlib import Path
 from werkzeug.exceptions import BadRequest
-import requests
 import os
+import json
+import inspect
+import yaml
+import time
 import asyncio
+import random
 import aiohttp
-from concurrent.futures import ThreadPoolExecutor
+import redis
+from datetime import datetime, timezone
+import redis.asyncio
 from dotenv import load_dotenv
+from fake_lta import FakeLTA
 
 # Load environment variables from .env file
 env_path = Path(__file__).resolve().parents[2] / ".env"
 load_dotenv(env_path)
 
-app = Flask(__name__)
-CORS(app)
-swagger = Swagger(app)
+# Served by an ASGI server (hypercorn): every handler, upstream call and background
+# task runs on the server's one event loop and shares one connection pool
+app = Quart(__name__)
+app = cors(app)
 
 # API endpoint
-LTA_API_URL = "https://datamall2.mytransport.sg/ltaodataservice/v3/BusArrival"
+LTA_API_URL = os.environ.get('LTA_API_URL', "https://datamall2.mytransport.sg/ltaodataservice/v3/BusArrival")
+
+# "live" calls LTA_API_URL; "fake" and "replay" use the in-process stand-in in fake_lta.py
+LTA_UPSTREAM = os.environ.get('LTA_UPSTREAM', 'live').lower()
+LTA_REPLAY_FILE = os.environ.get('LTA_REPLAY_FILE')
+# Append every live response to this file (JSON lines) to build replay recordings
+LTA_RECORD_FILE = os.environ.get('LTA_RECORD_FILE')
 
 LTA_API_KEY = os.environ.get('LTA_API_KEY')
 print(LTA_API_KEY)
 
-if not LTA_API_KEY:
+if not LTA_API_KEY and LTA_UPSTREAM == 'live':
     raise ValueError("LTA API Key not found. Please set the LTA_API_KEY environment variable.")
 
+if LTA_UPSTREAM in ('fake', 'replay'):
+    if LTA_UPSTREAM == 'replay' and not LTA_REPLAY_FILE:
+        raise ValueError("LTA_UPSTREAM=replay needs LTA_REPLAY_FILE.")
+    fake_upstream = FakeLTA(replay_file=LTA_REPLAY_FILE if LTA_UPSTREAM == 'replay' else None)
+    print(f"Using fake LTA upstream ({LTA_UPSTREAM})")
+else:
+    fake_upstream = None
+
 # API key loaded from environment variables
 HEADERS = {
-    "AccountKey": LTA_API_KEY,
+    "AccountKey": LTA_API_KEY or "",
     "accept": "application/json"
 }
 
-async def fetch_bus_arrival_async(bus_number, bus_stop_code):
-    """Fetch bus arrival information asynchronously"""
-    async with aiohttp.ClientSession() as session:
-        params = {
+# Connection pool to LTA DataMall, shared by every request
+LTA_MAX_CONNECTIONS = int(os.environ.get('LTA_MAX_CONNECTIONS', 100))
+LTA_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('LTA_MAX_CONNECTIONS_PER_HOST', 20))
+LTA_KEEPALIVE_TIMEOUT = float(os.environ.get('LTA_KEEPALIVE_TIMEOUT', 30))
+
+# Upstream protection: connect/read timeouts, bounded retries with full-jitter backoff,
+# and a circuit breaker that stops calling LTA after repeated failures
+LTA_CONNECT_TIMEOUT = float(os.environ.get('LTA_CONNECT_TIMEOUT', 3))
+LTA_READ_TIMEOUT = float(os.environ.get('LTA_READ_TIMEOUT', 5))
+LTA_MAX_RETRIES = int(os.environ.get('LTA_MAX_RETRIES', 2))
+LTA_RETRY_BACKOFF = float(os.environ.get('LTA_RETRY_BACKOFF', 0.2))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30))
+
+class UpstreamUnavailable(Exception):
+    """LTA could not be reached (timeouts/connection errors after retries, or circuit open)"""
+
+class CircuitBreaker:
+    """
+    closed: calls go through. After BREAKER_FAILURE_THRESHOLD consecutive failed calls -> open.
+    open: calls are rejected until BREAKER_RESET_TIMEOUT has passed -> half_open.
+    half_open: one trial call; success -> closed, failure -> open again. A trial that never
+    reported back is given up on after BREAKER_RESET_TIMEOUT and another one is allowed.
+    """
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = 0.0
+        self.stats = {"opened": 0, "half_open_trials": 0, "short_circuited": 0}
+
+    def allow(self):
+        now = time.monotonic()
+        if (self.state == "open" and now - self.opened_at >= self.reset_timeout) or \
+                (self.state == "half_open" and now - self.trial_started_at >= self.reset_timeout):
+            self.state = "half_open"
+            self.trial_started_at = now
+            self.stats["half_open_trials"] += 1
+            return True
+        if self.state != "closed":
+            self.stats["short_circuited"] += 1
+            return False
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker()
+upstream_stats = {"requests": 0, "retries": 0, "timeouts": 0, "errors": 0, "failed_calls": 0}
+
+# One keep-alive session for the life of the process, so connections survive across requests
+session = None
+
+async def get_session():
+    """Create the shared aiohttp session on first use (always on the server's loop)"""
+    global session
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=LTA_MAX_CONNECTIONS,
+            limit_per_host=LTA_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=LTA_KEEPALIVE_TIMEOUT
+        )
+        timeout = aiohttp.ClientTimeout(total=None, connect=LTA_CONNECT_TIMEOUT, sock_read=LTA_READ_TIMEOUT)
+        session = aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=timeout)
+    return session
+
+async def call_upstream(params):
+    """One upstream request, live or fake. Returns (status code, JSON body or error text)"""
+    if fake_upstream is not None:
+        return await fake_upstream.get(params, read_timeout=LTA_READ_TIMEOUT)
+
+    session = await get_session()
+    async with session.get(LTA_API_URL, params=params) as response:
+        if response.status == 200:
+            body = await response.json(content_type=None)
+            if LTA_RECORD_FILE:
+                record_response(body)
+            return response.status, body
+        return response.status, await response.text()
+
+def record_response(body):
+    with open(LTA_RECORD_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps({**body, "recorded_at": time.time()}) + "\n")
+
+async def fetch_lta_arrivals(params):
+    """
+    Call the LTA BusArrival API. Returns (status code, JSON body or error text).
+    Timeouts, connection errors, 429 and 5xx are retried; raises UpstreamUnavailable
+    when the circuit is open or the last attempt failed without a response.
+    """
+    if not breaker.allow():
+        raise UpstreamUnavailable("circuit open")
+
+    outcome_recorded = False
+    try:
+        for attempt in range(LTA_MAX_RETRIES + 1):
+            if attempt:
+                upstream_stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, LTA_RETRY_BACKOFF * 2 ** (attempt - 1)))
+            upstream_stats["requests"] += 1
+            try:
+                result = await call_upstream(params)
+                status = result[0]
+                if status == 200 or (status != 429 and status < 500):
+                    # Non-200 here means our request was rejected (e.g. bad key); LTA itself is healthy
+                    breaker.record_success()
+                    outcome_recorded = True
+                    return result
+                upstream_stats["errors"] += 1
+            except asyncio.TimeoutError:
+                upstream_stats["timeouts"] += 1
+                result = None
+            except (aiohttp.ClientError, ValueError) as e:
+                # ValueError: a 200 whose body is not JSON, e.g. a maintenance page
+                upstream_stats["errors"] += 1
+                result = None
+                print(f"LTA request failed: {e}")
+
+        upstream_stats["failed_calls"] += 1
+        breaker.record_failure()
+        outcome_recorded = True
+        if result is None:
+            raise UpstreamUnavailable(f"no response after {LTA_MAX_RETRIES + 1} attempts")
+        return result
+    finally:
+        # Anything else (unexpected errors, cancellation) still counts as a failed call,
+        # so a half-open trial always resolves
+        if not outcome_recorded:
+            upstream_stats["failed_calls"] += 1
+            breaker.record_failure()
+
+# Arrival cache keyed by BusStopCode, holding every service at the stop (LTA returns
+# all services when ServiceNo is omitted; we slice per service locally). Entries are fresh for ARRIVAL_TTL
+# seconds, then served stale while a background refresh runs, until ARRIVAL_STALE_TTL.
+# LTA only updates estimates every ~20-30 s. Set ARRIVAL_CACHE_REDIS_HOST to share
+# the cache between replicas.
+ARRIVAL_TTL = float(os.environ.get('ARRIVAL_TTL', 20))
+ARRIVAL_STALE_TTL = float(os.environ.get('ARRIVAL_STALE_TTL', 60))
+# While LTA is failing, last-known data up to this age is served instead of an error
+ARRIVAL_FALLBACK_TTL = float(os.environ.get('ARRIVAL_FALLBACK_TTL', 600))
+ARRIVAL_CACHE_MAX_ENTRIES = int(os.environ.get('ARRIVAL_CACHE_MAX_ENTRIES', 20000))
+ARRIVAL_CACHE_REDIS_HOST = os.environ.get('ARRIVAL_CACHE_REDIS_HOST')
+ARRIVAL_CACHE_REDIS_PORT = int(os.environ.get('ARRIVAL_CACHE_REDIS_PORT', 6379))
+
+arrival_cache = {}  # key -> (fetched_at epoch seconds, LTA response body)
+refreshing = set()
+cache_stats = {"hit": 0, "stale": 0, "miss": 0, "fallback": 0, "redis_hit": 0, "background_refresh": 0}
+fanout_stats = {"pairs_requested": 0, "stops_fetched": 0}
+
+# Upstream fetches in progress, keyed like the cache (single-flight)
+inflight = {}
+flight_stats = {"upstream_calls": 0, "coalesced": 0}
+
+# Background poller: every PREFETCH_INTERVAL seconds, refresh streamed stops, subscribed
+# stops (NotifyMe) and the most-queried stops, in that order, before their cache entries
+# go stale, spending at most PREFETCH_BUDGET_PER_MINUTE upstream calls to stay inside the
+# DataMall rate limit. PREFETCH_ENABLED=false turns off prefetching for subscribed and hot
+# stops only; open streams depend on the poller for their updates.
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'true').lower() == 'true'
+PREFETCH_INTERVAL = float(os.environ.get('PREFETCH_INTERVAL', 15))
+PREFETCH_BUDGET_PER_MINUTE = int(os.environ.get('PREFETCH_BUDGET_PER_MINUTE', 120))
+PREFETCH_MIN_QUERIES = float(os.environ.get('PREFETCH_MIN_QUERIES', 2))
+PREFETCH_DECAY = float(os.environ.get('PREFETCH_DECAY', 0.8))
+SUBSCRIPTION_TTL = float(os.environ.get('SUBSCRIPTION_TTL', 1800))
+
+query_counts = {}  # BusStopCode -> query count, decayed by PREFETCH_DECAY every prefetch cycle
+subscriptions = {}  # (BusStopCode, ServiceNo) -> expiry epoch seconds
+prefetch_stats = {"cycles": 0, "refreshed": 0, "skipped_fresh": 0, "over_budget": 0, "stream_over_budget": 0, "errors": 0}
+redis_client = (
+    redis.asyncio.Redis(host=ARRIVAL_CACHE_REDIS_HOST, port=ARRIVAL_CACHE_REDIS_PORT, decode_responses=True)
+    if ARRIVAL_CACHE_REDIS_HOST else None
+)
+
+def cache_key(bus_stop_code):
+    return str(bus_stop_code)
+
+async def read_cache(key):
+    entry = arrival_cache.get(key)
+    # Local copy missing or no longer fresh: another replica may have refreshed the stop
+    if redis_client is not None and (entry is None or time.time() - entry[0] >= ARRIVAL_TTL):
+        try:
+            raw = await redis_client.get(f"bus_arrival:{key}")
+            if raw:
+                shared = tuple(json.loads(raw))
+                if entry is None or shared[0] > entry[0]:
+                    entry = shared
+                    arrival_cache[key] = entry
+                    cache_stats["redis_hit"] += 1
+        except redis.RedisError as e:
+            print(f"Redis cache read failed: {e}")
+    return entry
+
+async def write_cache(key, body):
+    entry = (time.time(), body)
+    arrival_cache[key] = entry
+    if len(arrival_cache) > ARRIVAL_CACHE_MAX_ENTRIES:
+        # Drop the oldest entries first
+        for old_key, _ in sorted(arrival_cache.items(), key=lambda item: item[1][0])[:len(arrival_cache) // 10]:
+            del arrival_cache[old_key]
+    if redis_client is not None:
+        try:
+            await redis_client.set(f"bus_arrival:{key}", json.dumps(entry), ex=int(max(ARRIVAL_STALE_TTL, ARRIVAL_FALLBACK_TTL)))
+        except redis.RedisError as e:
+            print(f"Redis cache write failed: {e}")
+    publish_arrivals(key, body)
+    return entry
+
+async def fetch_and_store(key, bus_stop_code):
+    flight_stats["upstream_calls"] += 1
+    status, body = await fetch_lta_arrivals({"BusStopCode": bus_stop_code})
+    if status == 200:
+        await write_cache(key, body)
+    return status, body
+
+async def fetch_stop_arrivals(bus_stop_code):
+    """
+    Single-flight upstream fetch for one stop: concurrent callers for the same stop
+    await one shared task instead of each calling LTA. Returns (status code, body).
+    """
+    key = cache_key(bus_stop_code)
+    task = inflight.get(key)
+    if task is not None:
+        flight_stats["coalesced"] += 1
+    else:
+        task = asyncio.ensure_future(fetch_and_store(key, bus_stop_code))
+        inflight[key] = task
+        task.add_done_callback(lambda done: inflight.pop(key) if inflight.get(key) is done else None)
+    # Shielded so one caller going away does not cancel the fetch for the others
+    return await asyncio.shield(task)
+
+async def refresh_in_background(key, bus_stop_code):
+    try:
+        status, body = await fetch_stop_arrivals(bus_stop_code)
+        if status == 200:
+            cache_stats["background_refresh"] += 1
+    except Exception as e:
+        print(f"Background refresh of {key} failed: {e}")
+    finally:
+        refreshing.discard(key)
+
+async def get_stop_arrivals_cached(bus_stop_code):
+    """
+    Arrival data for every service at one stop through the cache.
+    Returns (status code, LTA body or error text, cache info with status and age).
+    """
+    key = cache_key(bus_stop_code)
+    query_counts[key] = query_counts.get(key, 0) + 1
+
+    entry = await read_cache(key)
+    if entry is not None:
+        age = time.time() - entry[0]
+        if age < ARRIVAL_TTL:
+            cache_stats["hit"] += 1
+            return 200, entry[1], {"status": "hit", "age_seconds": round(age, 1)}
+        if age < ARRIVAL_STALE_TTL:
+            cache_stats["stale"] += 1
+            if key not in refreshing:
+                refreshing.add(key)
+                asyncio.ensure_future(refresh_in_background(key, bus_stop_code))
+            return 200, entry[1], {"status": "stale", "age_seconds": round(age, 1)}
+
+    cache_stats["miss"] += 1
+    try:
+        status, body = await fetch_stop_arrivals(bus_stop_code)
+    except UpstreamUnavailable as e:
+        status, body = 503, f"LTA DataMall unavailable: {e}"
+
+    # LTA failing: serve last-known data rather than an error
+    if status != 200 and entry is not None and time.time() - entry[0] < ARRIVAL_FALLBACK_TTL:
+        cache_stats["fallback"] += 1
+        return 200, entry[1], {"status": "fallback", "age_seconds": round(time.time() - entry[0], 1)}
+    return status, body, {"status": "miss", "age_seconds": 0.0}
+
+async def prefetch_cycle():
+    now = time.time()
+    for pair, expires_at in list(subscriptions.items()):
+        if expires_at < now:
+            del subscriptions[pair]
+
+    streamed = list(stream_subscribers)
+    if PREFETCH_ENABLED:
+        subscribed = [cache_key(stop) for stop, _ in subscriptions]
+        hot = sorted((stop for stop, count in query_counts.items() if count >= PREFETCH_MIN_QUERIES),
+                     key=query_counts.get, reverse=True)
+    else:
+        subscribed, hot = [], []
+    budget = max(1, int(PREFETCH_BUDGET_PER_MINUTE * PREFETCH_INTERVAL / 60))
+
+    due = []
+    stream_dropped = 0
+    for stop in dict.fromkeys(streamed + subscribed + hot):
+        entry = arrival_cache.get(stop)
+        # Still fresh at the next cycle: nothing to do yet
+        if entry is not None and now - entry[0] < ARRIVAL_TTL - PREFETCH_INTERVAL:
+            prefetch_stats["skipped_fresh"] += 1
+        elif len(due) < budget:
+            due.append(stop)
+        elif stop in stream_subscribers:
+            stream_dropped += 1
+        else:
+            prefetch_stats["over_budget"] += 1
+    if stream_dropped:
+        prefetch_stats["stream_over_budget"] += stream_dropped
+        print(f"Prefetch budget ({budget} per cycle) exceeded: {stream_dropped} streamed stops not refreshed this cycle")
+
+    results = await asyncio.gather(*[fetch_stop_arrivals(stop) for stop in due], return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception) or result[0] != 200:
+            prefetch_stats["errors"] += 1
+        else:
+            prefetch_stats["refreshed"] += 1
+
+    for stop in list(query_counts):
+        query_counts[stop] *= PREFETCH_DECAY
+        if query_counts[stop] < 0.1:
+            del query_counts[stop]
+    prefetch_stats["cycles"] += 1
+
+async def prefetch_loop():
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL)
+        try:
+            await prefetch_cycle()
+        except Exception as e:
+            print(f"Prefetch cycle failed: {e}")
+
+background_tasks = []
+
+@app.before_serving
+async def start_background_tasks():
+    # Always polled: streams get their updates from it even with prefetching disabled
+    background_tasks.append(asyncio.ensure_future(prefetch_loop()))
+
+@app.after_serving
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if session is not None:
+        await session.close()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+async def update_subscriptions(pairs, ttl_seconds=None):
+    """Subscribe (stop, service) pairs for prefetching, or unsubscribe them when ttl_seconds is 0"""
+    expires_at = time.time() + (SUBSCRIPTION_TTL if ttl_seconds is None else ttl_seconds)
+    for pair in pairs:
+        if ttl_seconds == 0:
+            subscriptions.pop(pair, None)
+        else:
+            subscriptions[pair] = expires_at
+    return len(subscriptions)
+
+def slice_service(stop_body, service_no):
+    """The stop response narrowed to one service, as LTA returns it when ServiceNo is given"""
+    return {
+        **stop_body,
+        "Services": [service for service in stop_body.get("Services", []) if service.get("ServiceNo") == str(service_no)]
+    }
+
+async def get_bus_arrival_cached(bus_stop_code, service_no):
+    """Same as get_stop_arrivals_cached, narrowed to one service"""
+    status, body, cache = await get_stop_arrivals_cached(bus_stop_code)
+    if status == 200:
+        body = slice_service(body, service_no)
+    return status, body, cache
+
+# Live arrival streams (server-sent events). Each stream registers its (stop, service)
+# pairs; the background poller keeps those stops refreshed, and every new upstream
+# response for a stop is pushed to its streams when their slice of it changed.
+# One upstream poll per stop serves any number of subscribers.
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15))
+STREAM_MAX_PAIRS = int(os.environ.get('STREAM_MAX_PAIRS', 20))
+
+stream_subscribers = {}  # BusStopCode -> set of StreamSubscriber
+stream_stats = {"events_sent": 0, "streams_opened": 0}
+
+class StreamSubscriber:
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.events = asyncio.Queue()  # read by the stream's response generator
+        self.last_sent = {}
+
+    def offer(self, bus_stop_code, service_no, arrival_data, cache):
+        """Queue an event for the pair unless its data is unchanged since the last event"""
+        payload = json.dumps(arrival_data, sort_keys=True)
+        if self.last_sent.get((bus_stop_code, service_no)) == payload:
+            return
+        self.last_sent[(bus_stop_code, service_no)] = payload
+        self.events.put_nowait({
             "BusStopCode": bus_stop_code,
-            "ServiceNo": bus_number
-        }
-        
-        async with session.get(LTA_API_URL, headers=HEADERS, params=params) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                return {
-                    "error": f"Failed to fetch data for bus {bus_number} at stop {bus_stop_code}",
-                    "status_code": response.status
-                }
+            "ServiceNo": service_no,
+            "arrival_data": arrival_data,
+            "cache": cache
+        })
+        stream_stats["events_sent"] += 1
 
-def run_async_tasks(transit_details):
-    """Run async tasks in a separate thread"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
+def publish_arrivals(key, body):
+    for subscriber in stream_subscribers.get(key, ()):
+        for bus_stop_code, service_no in subscriber.pairs:
+            if cache_key(bus_stop_code) == key:
+                subscriber.offer(bus_stop_code, service_no, slice_service(body, service_no),
+                                 {"status": "hit", "age_seconds": 0.0})
+
+async def add_stream_subscriber(subscriber):
+    """Register a stream and send it the current arrivals for each of its pairs"""
+    stream_stats["streams_opened"] += 1
+    for bus_stop_code, _ in subscriber.pairs:
+        stream_subscribers.setdefault(cache_key(bus_stop_code), set()).add(subscriber)
+    for bus_stop_code, service_no in subscriber.pairs:
+        status, body, cache = await get_bus_arrival_cached(bus_stop_code, service_no)
+        if status == 200:
+            subscriber.offer(bus_stop_code, service_no, body, cache)
+
+async def remove_stream_subscriber(subscriber):
+    for bus_stop_code, _ in subscriber.pairs:
+        key = cache_key(bus_stop_code)
+        stream_subscribers.get(key, set()).discard(subscriber)
+        if not stream_subscribers.get(key):
+            stream_subscribers.pop(key, None)
+
+# Compact payloads: per upcoming bus, only the requested fields, with minutes to
+# arrival computed here so clients need not parse LTA's ISO timestamps
+COMPACT_FIELDS = {
+    "minutes": lambda bus, now: minutes_to_arrival(bus.get("EstimatedArrival"), now),
+    "load": lambda bus, now: bus.get("Load"),
+    "type": lambda bus, now: bus.get("Type"),
+    "feature": lambda bus, now: bus.get("Feature"),
+    "estimated_arrival": lambda bus, now: bus.get("EstimatedArrival"),
+    "monitored": lambda bus, now: bool(bus.get("Monitored"))
+}
+DEFAULT_COMPACT_FIELDS = ["minutes", "load", "type"]
+
+def minutes_to_arrival(estimated_arrival, now):
+    """Whole minutes until arrival (0 if due or past), None if LTA gave no estimate"""
+    if not estimated_arrival:
+        return None
+    try:
+        arrival_time = datetime.fromisoformat(estimated_arrival)
+    except ValueError:
+        return None
+    return max(0, int((arrival_time - now).total_seconds() // 60))
+
+def parse_compact_fields(args):
+    """None for the full LTA payload, otherwise the compact fields requested. Raises ValueError."""
+    if args.get("fields"):
+        fields = list(dict.fromkeys(field.strip().lower() for field in args["fields"].split(",") if field.strip()))
+        unknown = [field for field in fields if field not in COMPACT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(COMPACT_FIELDS)}")
+        return fields
+    if args.get("compact", "false").lower() == "true":
+        return DEFAULT_COMPACT_FIELDS
+    return None
+
+def compact_arrivals(body, fields):
+    now = datetime.now(timezone.utc)
+    services = []
+    for service in body.get("Services", []):
+        next_buses = []
+        for slot in ("NextBus", "NextBus2", "NextBus3"):
+            bus = service.get(slot) or {}
+            if bus.get("EstimatedArrival"):
+                next_buses.append({field: COMPACT_FIELDS[field](bus, now) for field in fields})
+        services.append({
+            "ServiceNo": service.get("ServiceNo"),
+            "Operator": service.get("Operator"),
+            "NextBuses": next_buses
+        })
+    return {"BusStopCode": body.get("BusStopCode"), "Services": services}
+
+async def fetch_transit_arrivals(transit_details, fields=None):
+    """Fetch each distinct stop once, concurrently, and fan out per-service answers"""
     results = []
-    bus_tasks = []
+    bus_details = []
     
-    # Create tasks for each bus detail
+    # Collect the bus legs
     for detail in transit_details:
         if "BusNumber" in detail and "BusStopCode" in detail:
-            bus_number = detail["BusNumber"]
-            bus_stop_code = detail["BusStopCode"]
-            
-            task = asyncio.ensure_future(fetch_bus_arrival_async(bus_number, bus_stop_code))
-            bus_tasks.append({
-                "task": task,
-                "detail": detail
-            })
+            bus_details.append(detail)
         elif "TrainLine" in detail:
             results.append({
                 "transit_type": "train",
@@ -76,26 +553,39 @@ def run_async_tasks(transit_details):
                 "message": "Train information not available from bus API"
             })
     
-    # Wait for all tasks to complete
-    if bus_tasks:
-        task_group = asyncio.gather(*[task_info["task"] for task_info in bus_tasks])
-        task_results = loop.run_until_complete(task_group)
+    # One upstream request per distinct stop, whatever the number of services asked for there
+    if bus_details:
+        stop_codes = list(dict.fromkeys(str(detail["BusStopCode"]) for detail in bus_details))
+        fanout_stats["pairs_requested"] += len(bus_details)
+        fanout_stats["stops_fetched"] += len(stop_codes)
+        stop_results = dict(zip(stop_codes, await asyncio.gather(
+            *[get_stop_arrivals_cached(code) for code in stop_codes]
+        )))
         
-        for i, task_result in enumerate(task_results):
-            detail = bus_tasks[i]["detail"]
+        for detail in bus_details:
+            status, body, cache = stop_results[str(detail["BusStopCode"])]
+            if status == 200:
+                arrival_data = slice_service(body, detail["BusNumber"])
+                if fields:
+                    arrival_data = compact_arrivals(arrival_data, fields)
+            else:
+                arrival_data = {
+                    "error": f"Failed to fetch data for bus {detail['BusNumber']} at stop {detail['BusStopCode']}",
+                    "status_code": status
+                }
             results.append({
                 "transit_type": "bus",
                 "bus_number": detail["BusNumber"],
                 "bus_stop_code": detail["BusStopCode"],
                 "description": detail.get("Description", ""),
-                "arrival_data": task_result
+                "arrival_data": arrival_data,
+                "cache": cache
             })
     
-    loop.close()
     return results
 
 @app.route('/bus-tracking', methods=['GET'])
-def get_bus_arrival():
+async def get_bus_arrival():
     """
     Get bus arrival information for a specific bus stop and service number.
     ---
@@ -110,9 +600,19 @@ def get_bus_arrival():
         type: string
         required: true
         description: Bus Service Number
+      - name: compact
+        in: query
+        type: boolean
+        required: false
+        description: Return only minutes to arrival, load and type for each upcoming bus
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated compact fields (minutes, load, type, feature, estimated_arrival, monitored); implies compact
     responses:
       200:
-        description: Successful response with bus arrival information
+        description: Successful response with bus arrival information, plus cache status and age (also in X-Cache and Age headers)
       400:
         description: Bad request (invalid input)
       500:
@@ -129,20 +629,26 @@ def get_bus_arrival():
         if not service_no:
             return jsonify({"error": "Missing ServiceNo parameter"}), 400
         
-        # Call the LTA API
-        response = requests.get(
-            LTA_API_URL,
-            headers=HEADERS,
-            params={"BusStopCode": bus_stop_code, "ServiceNo": service_no}
-        )
+        try:
+            fields = parse_compact_fields(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        if response.status_code == 200:
-            return jsonify(response.json())
+        # Serve from the arrival cache, calling the LTA API on the shared session when needed
+        status, body, cache = await get_bus_arrival_cached(bus_stop_code, service_no)
+        
+        if status == 200:
+            if fields:
+                body = compact_arrivals(body, fields)
+            response = jsonify({**body, "cache": cache})
+            response.headers["X-Cache"] = cache["status"].upper()
+            response.headers["Age"] = str(int(cache["age_seconds"]))
+            return response
         else:
             return jsonify({
-                "error": f"API request failed with status {response.status_code}",
-                "response": response.text
-            }), response.status_code
+                "error": f"API request failed with status {status}",
+                "response": body
+            }), status
             
     except BadRequest as e:
         return jsonify({"error": str(e)}), 400
@@ -150,7 +656,7 @@ def get_bus_arrival():
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
 
 @app.route('/bus-tracking', methods=['POST'])
-def post_bus_arrival():
+async def post_bus_arrival():
     """
     Get bus arrival information for multiple bus stops and service numbers.
     ---
@@ -174,6 +680,16 @@ def post_bus_arrival():
                     type: string
                   TrainLine:
                     type: string
+      - name: compact
+        in: query
+        type: boolean
+        required: false
+        description: Return only minutes to arrival, load and type for each upcoming bus
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated compact fields (minutes, load, type, feature, estimated_arrival, monitored); implies compact
     responses:
       200:
         description: Successful response with multiple bus arrival information
@@ -183,16 +699,20 @@ def post_bus_arrival():
         description: Server error
     """
     try:
-        data = request.json
+        data = await request.get_json()
         
         if not data or "transit_details" not in data:
             return jsonify({"error": "Missing transit_details in request body"}), 400
         
         transit_details = data["transit_details"]
         
-        # Use ThreadPoolExecutor to run async code in a separate thread
-        with ThreadPoolExecutor() as executor:
-            results = executor.submit(run_async_tasks, transit_details).result()
+        try:
+            fields = parse_compact_fields(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Fetch all legs concurrently on the shared session
+        results = await fetch_transit_arrivals(transit_details, fields)
         
         return jsonify({"results": results})
             
@@ -201,5 +721,220 @@ def post_bus_arrival():
     except Exception as e:
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
 
+@app.route('/bus-tracking/stream', methods=['GET'])
+async def stream_bus_arrival():
+    """
+    Stream live arrival updates as server-sent events ("arrival" events, one per changed stop/service pair).
+    ---
+    parameters:
+      - name: pairs
+        in: query
+        type: string
+        required: false
+        description: Comma-separated BusStopCode:ServiceNo pairs, e.g. 83139:15,83139:155
+      - name: BusStopCode
+        in: query
+        type: string
+        required: false
+        description: LTA Bus Stop Code (single pair, with ServiceNo)
+      - name: ServiceNo
+        in: query
+        type: string
+        required: false
+        description: Bus Service Number (single pair, with BusStopCode)
+      - name: compact
+        in: query
+        type: boolean
+        required: false
+        description: Return only minutes to arrival, load and type for each upcoming bus
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated compact fields (minutes, load, type, feature, estimated_arrival, monitored); implies compact
+    responses:
+      200:
+        description: text/event-stream of arrival updates
+      400:
+        description: Bad request (invalid input)
+    """
+    pairs = []
+    for item in filter(None, request.args.get("pairs", "").split(",")):
+        bus_stop_code, _, service_no = item.strip().partition(":")
+        if not bus_stop_code or not service_no:
+            return jsonify({"error": f"Invalid pair '{item}', expected BusStopCode:ServiceNo"}), 400
+        pairs.append((bus_stop_code, service_no))
+    if request.args.get("BusStopCode") and request.args.get("ServiceNo"):
+        pairs.append((request.args["BusStopCode"], request.args["ServiceNo"]))
+
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return jsonify({"error": "Provide pairs=BusStopCode:ServiceNo,... or BusStopCode and ServiceNo"}), 400
+    if len(pairs) > STREAM_MAX_PAIRS:
+        return jsonify({"error": f"Too many pairs ({len(pairs)}), maximum is {STREAM_MAX_PAIRS}"}), 400
+    try:
+        fields = parse_compact_fields(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    subscriber = StreamSubscriber(pairs)
+
+    async def generate():
+        await add_stream_subscriber(subscriber)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.events.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if fields:
+                    event = {**event, "arrival_data": compact_arrivals(event["arrival_data"], fields)}
+                yield f"event: arrival\ndata: {json.dumps(event)}\n\n"
+        finally:
+            await remove_stream_subscriber(subscriber)
+
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Streams stay open until the client goes away
+    response.timeout = None
+    return response
+
+@app.route('/bus-tracking/subscriptions', methods=['POST', 'DELETE'])
+async def bus_tracking_subscriptions():
+    """
+    Subscribe (POST) or unsubscribe (DELETE) bus stop/service pairs for background prefetching.
+    ---
+    parameters:
+      - name: subscriptions
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            subscriptions:
+              type: array
+              items:
+                type: object
+                properties:
+                  BusStopCode:
+                    type: string
+                  ServiceNo:
+                    type: string
+            ttl_seconds:
+              type: number
+              description: How long a subscription lasts (POST only, defaults to SUBSCRIPTION_TTL)
+    responses:
+      200:
+        description: Number of active subscriptions
+      400:
+        description: Bad request (invalid input)
+    """
+    data = await request.get_json(silent=True) or {}
+    items = data.get("subscriptions")
+    if not isinstance(items, list) or not all(
+        isinstance(item, dict) and item.get("BusStopCode") and item.get("ServiceNo") for item in items
+    ):
+        return jsonify({"error": "subscriptions must be a list of {BusStopCode, ServiceNo}"}), 400
+
+    pairs = [(str(item["BusStopCode"]), str(item["ServiceNo"])) for item in items]
+    if request.method == 'DELETE':
+        ttl_seconds = 0
+    else:
+        try:
+            ttl_seconds = float(data["ttl_seconds"]) if "ttl_seconds" in data else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "ttl_seconds must be a number"}), 400
+        if ttl_seconds is not None and ttl_seconds <= 0:
+            return jsonify({"error": "ttl_seconds must be positive"}), 400
+
+    active = await update_subscriptions(pairs, ttl_seconds)
+    return jsonify({"subscriptions": active})
+
+@app.route('/bus-tracking/stats', methods=['GET'])
+async def get_bus_tracking_stats():
+    """
+    Arrival cache counters.
+    ---
+    responses:
+      200:
+        description: Cache hits, stale hits, misses, Redis hits, background refreshes and size, (stop, service) pairs requested vs stops fetched, upstream calls vs coalesced callers, retry/timeout/circuit breaker, prefetch and stream counters
+    """
+    return jsonify({
+        "cache": {
+            **cache_stats,
+            "entries": len(arrival_cache),
+            "ttl_seconds": ARRIVAL_TTL,
+            "stale_ttl_seconds": ARRIVAL_STALE_TTL,
+            "redis_tier": redis_client is not None
+        },
+        "fanout": fanout_stats,
+        "single_flight": {**flight_stats, "in_flight": len(inflight)},
+        "upstream": {
+            **upstream_stats,
+            "mode": LTA_UPSTREAM,
+            "fake": fake_upstream.stats if fake_upstream is not None else None,
+            **breaker.stats,
+            "breaker_state": breaker.state,
+            "consecutive_failures": breaker.failures
+        },
+        "prefetch": {
+            **prefetch_stats,
+            "enabled": PREFETCH_ENABLED,
+            "interval_seconds": PREFETCH_INTERVAL,
+            "budget_per_minute": PREFETCH_BUDGET_PER_MINUTE,
+            "hot_stops": len(query_counts),
+            "subscriptions": len(subscriptions)
+        },
+        "streams": {
+            **stream_stats,
+            "streamed_stops": len(stream_subscribers),
+            "open_streams": len({id(s) for subs in stream_subscribers.values() for s in subs})
+        }
+    })
+
+# API docs at /apidocs/, as flasgger served them under Flask: the spec is built from the
+# YAML after "---" in each route's docstring and rendered with Swagger UI
+# Swagger UI's assets come from this CDN, so offline (e.g. LTA_UPSTREAM=fake/replay
+# without internet) the /apidocs/ page stays blank; /apispec_1.json is still served.
+# Point SWAGGER_UI_URL at a local copy of swagger-ui-dist to use the page offline.
+SWAGGER_UI_URL = os.environ.get('SWAGGER_UI_URL', "https://cdn.jsdelivr.net/npm/swagger-ui-dist@5")
+
+def build_apispec():
+    paths = {}
+    for rule in app.url_map.iter_rules():
+        view = app.view_functions.get(rule.endpoint)
+        summary, separator, spec = inspect.cleandoc(getattr(view, "__doc__", None) or "").partition("---")
+        if not separator:
+            continue
+        operation = {"summary": " ".join(summary.split()), **(yaml.safe_load(spec) or {})}
+        path = rule.rule.replace("<", "{").replace(">", "}")
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            paths.setdefault(path, {})[method.lower()] = operation
+    return {
+        "swagger": "2.0",
+        "info": {"title": "Bus Tracking API", "version": "1.0"},
+        "paths": paths
+    }
+
+@app.route('/apispec_1.json', methods=['GET'])
+async def get_apispec():
+    return jsonify(build_apispec())
+
+@app.route('/apidocs/', methods=['GET'])
+async def get_apidocs():
+    return Response(f"""<!DOCTYPE html>
+<html>
+<head>
+  <title>Bus Tracking API</title>
+  <link rel="stylesheet" href="{SWAGGER_UI_URL}/swagger-ui.css">
+</head>
+<body>
+  <div id="swagger-ui"></div>
+  <script src="{SWAGGER_UI_URL}/swagger-ui-bundle.js"></script>
+  <script>SwaggerUIBundle({{url: "../apispec_1.json", dom_id: "#swagger-ui"}});</script>
+</body>
+</html>""", mimetype="text/html")
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5030, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5030, debug=True)
@@ -0,0 +1,167 @@
+# fake_lta.py
+# Stand-in for the LTA DataMall BusArrival API, for load-testing bus_tracking offline.
+#
+# In-process: start bus_tracking with LTA_UPSTREAM=fake (synthetic arrivals) or
+# LTA_UPSTREAM=replay with LTA_REPLAY_FILE (recorded responses, synthetic for other stops).
+# Over HTTP: python fake_lta.py --port 5099, then run bus_tracking with
+# LTA_API_URL=http://localhost:5099/ltaodataservice/v3/BusArrival and any LTA_API_KEY.
+#
+# Recordings are JSON lines, one BusArrival response per line with a "recorded_at"
+# epoch field, as written by bus_tracking when LTA_RECORD_FILE is set.
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import zlib
+from datetime import datetime, timedelta, timezone
+
+FAKE_LTA_LATENCY_MS = float(os.environ.get('FAKE_LTA_LATENCY_MS', 50))
+FAKE_LTA_LATENCY_JITTER_MS = float(os.environ.get('FAKE_LTA_LATENCY_JITTER_MS', 20))
+FAKE_LTA_ERROR_RATE = float(os.environ.get('FAKE_LTA_ERROR_RATE', 0))
+FAKE_LTA_TIMEOUT_RATE = float(os.environ.get('FAKE_LTA_TIMEOUT_RATE', 0))
+
+SGT = timezone(timedelta(hours=8))
+LOADS = ["SEA", "SDA", "LSD"]
+TYPES = ["SD", "DD", "BD"]
+EMPTY_BUS = {
+    "OriginCode": "", "DestinationCode": "", "EstimatedArrival": "", "Monitored": 0,
+    "Latitude": "0.0", "Longitude": "0.0", "VisitNumber": "", "Load": "", "Feature": "", "Type": ""
+}
+
+def _seed(*parts):
+    return zlib.crc32(":".join(str(part) for part in parts).encode())
+
+def synthetic_arrivals(bus_stop_code, now=None):
+    """
+    A BusArrival-shaped response for any stop. The services at a stop and their
+    headways are fixed per stop code; arrival times advance with the clock, so
+    repeated calls change like real data.
+    """
+    now = now or time.time()
+    stop_rng = random.Random(_seed(bus_stop_code))
+    services = []
+    for service_no in sorted({str(stop_rng.randint(2, 999)) for _ in range(stop_rng.randint(2, 8))}, key=int):
+        headway = stop_rng.randint(4, 15) * 60
+        phase = stop_rng.randint(0, headway)
+        first_arrival = now + (phase - now) % headway
+        service = {"ServiceNo": service_no, "Operator": stop_rng.choice(["SBST", "SMRT", "TTS", "GAS"])}
+        for slot_index, slot in enumerate(("NextBus", "NextBus2", "NextBus3")):
+            arrival = first_arrival + slot_index * headway
+            bus_rng = random.Random(_seed(bus_stop_code, service_no, int(arrival // headway)))
+            service[slot] = {
+                "OriginCode": "", "DestinationCode": "",
+                "EstimatedArrival": datetime.fromtimestamp(arrival, SGT).isoformat(timespec="seconds"),
+                "Monitored": 1,
+                "Latitude": "0.0", "Longitude": "0.0",
+                "VisitNumber": "1",
+                "Load": bus_rng.choice(LOADS),
+                "Feature": "WAB",
+                "Type": bus_rng.choice(TYPES)
+            } if slot_index < 2 or bus_rng.random() < 0.8 else dict(EMPTY_BUS)
+        services.append(service)
+    return {"odata.metadata": "fake", "BusStopCode": str(bus_stop_code), "Services": services}
+
+def shift_timestamps(body, seconds):
+    """Move every EstimatedArrival in a recorded response forward by the time since it was recorded"""
+    shifted = json.loads(json.dumps(body))
+    for service in shifted.get("Services", []):
+        for slot in ("NextBus", "NextBus2", "NextBus3"):
+            bus = service.get(slot) or {}
+            if bus.get("EstimatedArrival"):
+                arrival = datetime.fromisoformat(bus["EstimatedArrival"]) + timedelta(seconds=seconds)
+                bus["EstimatedArrival"] = arrival.isoformat(timespec="seconds")
+    return shifted
+
+def load_recordings(path):
+    """Recorded responses per stop, in file order"""
+    recordings = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                body = json.loads(line)
+                recordings.setdefault(str(body.get("BusStopCode")), []).append(body)
+    return recordings
+
+class FakeLTA:
+    def __init__(self, replay_file=None, latency_ms=FAKE_LTA_LATENCY_MS, jitter_ms=FAKE_LTA_LATENCY_JITTER_MS,
+                 error_rate=FAKE_LTA_ERROR_RATE, timeout_rate=FAKE_LTA_TIMEOUT_RATE, seed=None):
+        self.recordings = load_recordings(replay_file) if replay_file else {}
+        self.replay_position = {}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "replayed": 0, "synthetic": 0}
+
+    def next_recording(self, bus_stop_code):
+        """Cycle through a stop's recordings, re-based to the current time"""
+        recordings = self.recordings.get(bus_stop_code)
+        if not recordings:
+            return None
+        position = self.replay_position.get(bus_stop_code, 0)
+        self.replay_position[bus_stop_code] = (position + 1) % len(recordings)
+        recording = recordings[position]
+        body = {key: value for key, value in recording.items() if key != "recorded_at"}
+        return shift_timestamps(body, time.time() - recording.get("recorded_at", time.time()))
+
+    async def get(self, params, read_timeout=None):
+        """Same contract as one upstream call: (status code, JSON body or error text)"""
+        self.stats["requests"] += 1
+        latency = max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+        if self.rng.random() < self.timeout_rate:
+            self.stats["timeouts"] += 1
+            await asyncio.sleep(read_timeout if read_timeout is not None else latency)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(latency)
+        if self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return 500, "Fake LTA error"
+
+        bus_stop_code = str(params.get("BusStopCode", ""))
+        body = self.next_recording(bus_stop_code)
+        if body is not None:
+            self.stats["replayed"] += 1
+        else:
+            self.stats["synthetic"] += 1
+            body = synthetic_arrivals(bus_stop_code)
+
+        if params.get("ServiceNo"):
+            body = {**body, "Services": [s for s in body["Services"] if s["ServiceNo"] == str(params["ServiceNo"])]}
+        return 200, body
+
+def serve(port, replay_file=None):
+    """Serve FakeLTA over HTTP at /ltaodataservice/v3/BusArrival"""
+    from aiohttp import web
+
+    fake = FakeLTA(replay_file=replay_file)
+
+    async def bus_arrival(request):
+        try:
+            status, body = await fake.get(request.query)
+        except asyncio.TimeoutError:
+            # Hold the connection open so the client's read timeout fires
+            await asyncio.sleep(3600)
+            raise
+        if status == 200:
+            return web.json_response(body)
+        return web.Response(status=status, text=body)
+
+    async def stats(request):
+        return web.json_response(fake.stats)
+
+    app = web.Application()
+    app.router.add_get("/ltaodataservice/v3/BusArrival", bus_arrival)
+    app.router.add_get("/stats", stats)
+    web.run_app(app, port=port)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake LTA BusArrival API for offline load tests")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--replay-file", default=os.environ.get('LTA_REPLAY_FILE'),
+                        help="JSON lines of recorded BusArrival responses")
+    args = parser.parse_args()
+    serve(args.port, args.replay_file)
@@ -2,8 +2,19 @@
 # http://localhost:5001/apidocs/
 from flask import Flask, request, jsonify
 import os
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ReadTimeoutError
+import redis
 from dotenv import load_dotenv
 from flasgger import Swagger
 from flask_cors import CORS
@@ -23,7 +34,13 @@ CORS(app)
 google_maps_api_key = os.environ.get('GOOGLE_MAPS_API_KEY')
 print(google_maps_api_key)
 
-if not google_maps_api_key:
+# "live" calls Google; "record" also saves each response as a fixture;
+# "replay" serves fixtures only, so no API key or network is needed
+DIRECTIONS_MODE = os.environ.get('DIRECTIONS_MODE', 'live').lower()
+if DIRECTIONS_MODE not in ('live', 'record', 'replay'):
+    raise ValueError("DIRECTIONS_MODE must be live, record or replay.")
+
+if not google_maps_api_key and DIRECTIONS_MODE != 'replay':
     raise ValueError("Google Maps API Key not found. Please set the GOOGLE_MAPS_API_KEY environment variable.")
 
 # Initialize Swagger for documentation
@@ -41,12 +58,301 @@ app.config['SWAGGER'] = {
 }
 swagger = Swagger(app)
 
+# One keep-alive session to Google for the life of the process, so requests reuse
+# pooled TLS connections instead of handshaking on every call. Connect/read timeouts
+# bound a slow upstream; connection errors, 429 and 5xx are retried with backoff.
+GOOGLE_DIRECTIONS_URL = os.environ.get('GOOGLE_DIRECTIONS_URL', "https://maps.googleapis.com/maps/api/directions/json")
+GOOGLE_POOL_SIZE = int(os.environ.get('GOOGLE_POOL_SIZE', 20))
+GOOGLE_CONNECT_TIMEOUT = float(os.environ.get('GOOGLE_CONNECT_TIMEOUT', 3))
+GOOGLE_READ_TIMEOUT = float(os.environ.get('GOOGLE_READ_TIMEOUT', 10))
+GOOGLE_MAX_RETRIES = int(os.environ.get('GOOGLE_MAX_RETRIES', 2))
+GOOGLE_RETRY_BACKOFF = float(os.environ.get('GOOGLE_RETRY_BACKOFF', 0.3))
+
+http = requests.Session()
+google_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=GOOGLE_POOL_SIZE,
+    max_retries=Retry(
+        total=GOOGLE_MAX_RETRIES,
+        backoff_factor=GOOGLE_RETRY_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        raise_on_status=False
+    )
+)
+http.mount("https://", google_adapter)
+http.mount("http://", google_adapter)
+
+# Upstream call latency histogram: bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = [50, 100, 200, 300, 500, 750, 1000, 2000, 5000]
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, elapsed_ms):
+        index = next((i for i, bound in enumerate(self.buckets) if elapsed_ms <= bound), len(self.buckets))
+        with self.lock:
+            self.counts[index] += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls (None past the last bound)"""
+        calls = sum(self.counts)
+        if not calls:
+            return None
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= fraction * calls:
+                return self.buckets[index] if index < len(self.buckets) else None
+        return None
+
+    def stats(self):
+        with self.lock:
+            calls = sum(self.counts)
+            return {
+                "calls": calls,
+                "mean_ms": round(self.total_ms / calls, 1) if calls else 0.0,
+                "max_ms": round(self.max_ms, 1),
+                "p50_ms": self.percentile(0.5),
+                "p95_ms": self.percentile(0.95),
+                "p99_ms": self.percentile(0.99),
+                "buckets": {
+                    **{f"le_{bound}": self.counts[i] for i, bound in enumerate(self.buckets)},
+                    "gt_" + str(self.buckets[-1]): self.counts[-1]
+                }
+            }
+
+upstream_latency = LatencyHistogram()
+upstream_stats = {"requests": 0, "errors": 0, "timeouts": 0, "connection_errors": 0}
+
+# Directions response cache. Commuter origin/destination pairs repeat constantly, so
+# responses are cached for DIRECTIONS_CACHE_TTL seconds under a key built from the
+# normalized request parameters, with departure_time rounded down to a
+# DEPARTURE_TIME_BUCKET-second window. Set DIRECTIONS_CACHE_REDIS_HOST to share the
+# cache between replicas; the in-process LRU sits in front of it.
+# The LRU holds compact JSON, bounded by DIRECTIONS_CACHE_MAX_BYTES as well as by entry
+# count. A transit response with alternatives is ~70 KB (sample_response.json), so the
+# 32 MB default holds ~450 of those per process; parsed, each would take ~270 KB.
+DIRECTIONS_CACHE_SIZE = int(os.environ.get('DIRECTIONS_CACHE_SIZE', 1000))
+DIRECTIONS_CACHE_MAX_BYTES = int(os.environ.get('DIRECTIONS_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+DIRECTIONS_CACHE_TTL = float(os.environ.get('DIRECTIONS_CACHE_TTL', 600))
+DEPARTURE_TIME_BUCKET = int(os.environ.get('DEPARTURE_TIME_BUCKET', 300))
+DIRECTIONS_CACHE_REDIS_HOST = os.environ.get('DIRECTIONS_CACHE_REDIS_HOST')
+DIRECTIONS_CACHE_REDIS_PORT = int(os.environ.get('DIRECTIONS_CACHE_REDIS_PORT', 6379))
+# Coordinates given as "lat,lng" are rounded to this many decimals (5 ~ 1 m)
+COORD_PRECISION = int(os.environ.get('COORD_PRECISION', 5))
+
+# Google statuses worth caching; anything else (quota, denied, unknown error) is retried next time
+CACHEABLE_STATUSES = {"OK", "ZERO_RESULTS", "NOT_FOUND"}
+
+class DirectionsCache:
+    """LRU of serialized responses with per-entry TTL, bounded by entry count and total bytes"""
+    def __init__(self, max_size=DIRECTIONS_CACHE_SIZE, max_bytes=DIRECTIONS_CACHE_MAX_BYTES, ttl=DIRECTIONS_CACHE_TTL):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (stored_at epoch seconds, response JSON)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """(stored_at epoch seconds, response) or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+        return entry[0], json.loads(entry[1])
+
+    def put(self, key, stored_at, directions):
+        payload = json.dumps(directions, separators=(",", ":"))
+        if self.max_size <= 0 or len(payload) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (stored_at, payload)
+            self.bytes += len(payload)
+            while len(self.entries) > self.max_size or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= len(self.entries.pop(key)[1])
+
+    def __len__(self):
+        return len(self.entries)
+
+directions_cache = DirectionsCache()
+cache_stats = {"hit": 0, "redis_hit": 0, "miss": 0, "uncacheable": 0}
+stats_lock = threading.Lock()
+redis_client = (
+    redis.Redis(host=DIRECTIONS_CACHE_REDIS_HOST, port=DIRECTIONS_CACHE_REDIS_PORT,
+                decode_responses=True, socket_timeout=0.5, socket_connect_timeout=0.5)
+    if DIRECTIONS_CACHE_REDIS_HOST else None
+)
+
+def count(stat):
+    with stats_lock:
+        cache_stats[stat] += 1
+
+def normalize_place(place):
+    """Case- and whitespace-insensitive place text; "lat,lng" rounded to COORD_PRECISION"""
+    place = " ".join(place.split()).lower()
+    parts = place.split(",")
+    if len(parts) == 2:
+        try:
+            lat, lng = float(parts[0]), float(parts[1])
+        except ValueError:
+            return place
+        return f"{round(lat, COORD_PRECISION)},{round(lng, COORD_PRECISION)}"
+    return place
+
+def bucket_departure_time(departure_time, now=None):
+    """Start of the DEPARTURE_TIME_BUCKET window holding the departure (now when absent)"""
+    if not departure_time or departure_time == "now":
+        departure = int(now or time.time())
+    else:
+        try:
+            departure = int(departure_time)
+        except ValueError:
+            return departure_time
+    return departure - departure % DEPARTURE_TIME_BUCKET if DEPARTURE_TIME_BUCKET > 0 else departure
+
+def normalize_request(origin, destination, optional_params):
+    """The request parameters in canonical form, departure_time left as given"""
+    params = {key: str(value).strip().lower() for key, value in optional_params.items()}
+    if params.get("avoid"):
+        params["avoid"] = "|".join(sorted(filter(None, params["avoid"].replace(",", "|").split("|"))))
+    params["origin"] = normalize_place(origin)
+    params["destination"] = normalize_place(destination)
+    return params
+
+def directions_cache_key(origin, destination, optional_params):
+    params = normalize_request(origin, destination, optional_params)
+    params["departure_time"] = bucket_departure_time(params.get("departure_time"))
+    return "directions:" + json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+def read_cache(key):
+    entry = directions_cache.get(key)
+    if entry is not None:
+        count("hit")
+        return entry
+    if redis_client is not None:
+        try:
+            raw = redis_client.get(key)
+        except redis.RedisError as e:
+            print(f"Redis cache read failed: {e}")
+            raw = None
+        if raw:
+            entry = tuple(json.loads(raw))
+            directions_cache.put(key, *entry)
+            count("redis_hit")
+            return entry
+    return None
+
+def write_cache(key, directions):
+    entry = (time.time(), directions)
+    directions_cache.put(key, *entry)
+    if redis_client is not None:
+        try:
+            redis_client.set(key, json.dumps(entry), ex=max(1, int(DIRECTIONS_CACHE_TTL)))
+        except redis.RedisError as e:
+            print(f"Redis cache write failed: {e}")
+
+def get_directions_cached(origin, destination, **optional_params):
+    """
+    get_google_maps_directions through the cache.
+    Returns (directions, cache info with status "hit" or "miss" and age in seconds).
+    """
+    key = directions_cache_key(origin, destination, optional_params)
+    entry = read_cache(key)
+    if entry is not None:
+        return entry[1], {"status": "hit", "age_seconds": round(time.time() - entry[0], 1)}
+
+    count("miss")
+    directions = get_google_maps_directions(origin, destination, **optional_params)
+    if directions.get("status") in CACHEABLE_STATUSES:
+        write_cache(key, directions)
+    else:
+        count("uncacheable")
+    return directions, {"status": "miss", "age_seconds": 0.0}
+
+# Fixtures for record/replay: one JSON file per trip in DIRECTIONS_FIXTURE_DIR, holding
+# the normalized request and Google's response. Replay matches on everything but
+# departure_time and serves DIRECTIONS_SEED_FILE for trips without a fixture, after
+# DIRECTIONS_REPLAY_LATENCY_MS (+/- jitter) to stand in for the Google round trip.
+DIRECTIONS_FIXTURE_DIR = Path(os.environ.get('DIRECTIONS_FIXTURE_DIR', Path(__file__).resolve().parent / "fixtures"))
+DIRECTIONS_SEED_FILE = Path(os.environ.get('DIRECTIONS_SEED_FILE', Path(__file__).resolve().parent / "sample_response.json"))
+DIRECTIONS_REPLAY_LATENCY_MS = float(os.environ.get('DIRECTIONS_REPLAY_LATENCY_MS', 0))
+DIRECTIONS_REPLAY_JITTER_MS = float(os.environ.get('DIRECTIONS_REPLAY_JITTER_MS', 0))
+
+class FixtureStore:
+    def __init__(self, directory=DIRECTIONS_FIXTURE_DIR, seed_file=DIRECTIONS_SEED_FILE):
+        self.directory = Path(directory)
+        self.fixtures = {}
+        self.lock = threading.Lock()
+        self.stats = {"replayed": 0, "seeded": 0, "recorded": 0}
+        if self.directory.is_dir():
+            for path in sorted(self.directory.glob("*.json")):
+                with open(path, encoding="utf-8") as f:
+                    fixture = json.load(f)
+                self.fixtures[self.key(fixture["request"])] = fixture["response"]
+        self.seed = None
+        if seed_file and Path(seed_file).is_file():
+            with open(seed_file, encoding="utf-8") as f:
+                self.seed = json.load(f)
+
+    @staticmethod
+    def key(request_params):
+        matched = {key: value for key, value in request_params.items() if key != "departure_time"}
+        return hashlib.sha1(json.dumps(matched, sort_keys=True).encode()).hexdigest()[:16]
+
+    def replay(self, request_params):
+        """The recorded response for the trip, else the seed response, else None"""
+        response = self.fixtures.get(self.key(request_params))
+        with self.lock:
+            self.stats["replayed" if response is not None else "seeded"] += 1
+        return response if response is not None else self.seed
+
+    def record(self, request_params, response):
+        key = self.key(request_params)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / f"{key}.json", "w", encoding="utf-8") as f:
+            json.dump({"request": request_params, "response": response}, f)
+        with self.lock:
+            self.fixtures[key] = response
+            self.stats["recorded"] += 1
+
+    def __len__(self):
+        return len(self.fixtures)
+
+fixture_store = FixtureStore() if DIRECTIONS_MODE in ('record', 'replay') else None
+if fixture_store is not None:
+    print(f"Directions {DIRECTIONS_MODE} mode: {len(fixture_store)} fixtures in {DIRECTIONS_FIXTURE_DIR}")
+
+def replay_directions(origin, destination, optional_params):
+    time.sleep(max(0.0, random.gauss(DIRECTIONS_REPLAY_LATENCY_MS, DIRECTIONS_REPLAY_JITTER_MS)) / 1000)
+    directions = fixture_store.replay(normalize_request(origin, destination, optional_params))
+    if directions is None:
+        return {"error": "No fixture or seed response to replay", "status_code": 404}
+    return directions
+
 def get_google_maps_directions(origin, destination, **optional_params):
     """
     Calls the Google Maps Directions API with required and optional parameters.
     """
-    base_url = "https://maps.googleapis.com/maps/api/directions/json"
-    
     # Define required parameters
     params = {
         'origin': origin,
@@ -57,15 +363,148 @@ def get_google_maps_directions(origin, destination, **optional_params):
     # Include optional parameters
     params.update(optional_params)
     
-    # Call the API
-    response = requests.get(base_url, params=params)
+    # Call the API over the pooled session (or serve a fixture in replay mode)
+    with stats_lock:
+        upstream_stats["requests"] += 1
+    started = time.perf_counter()
+    if DIRECTIONS_MODE == 'replay':
+        try:
+            return replay_directions(origin, destination, optional_params)
+        finally:
+            upstream_latency.observe((time.perf_counter() - started) * 1000)
+    try:
+        response = http.get(GOOGLE_DIRECTIONS_URL, params=params, timeout=(GOOGLE_CONNECT_TIMEOUT, GOOGLE_READ_TIMEOUT))
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        # A read timeout that used up the retries arrives as a ConnectionError wrapping it
+        reason = getattr(e.args[0], "reason", None) if e.args else None
+        if isinstance(e, requests.exceptions.Timeout) or isinstance(reason, ReadTimeoutError):
+            with stats_lock:
+                upstream_stats["timeouts"] += 1
+            return {"error": "Timed out fetching directions from Google Maps API", "status_code": 504}
+        with stats_lock:
+            upstream_stats["connection_errors"] += 1
+        print(f"Google Maps request failed: {e}")
+        return {"error": "Could not connect to Google Maps API", "status_code": 502}
+    finally:
+        upstream_latency.observe((time.perf_counter() - started) * 1000)
     
     # If successful, return the directions
     if response.status_code == 200:
-        return response.json()
+        directions = response.json()
+        if DIRECTIONS_MODE == 'record' and directions.get("status") in CACHEABLE_STATUSES:
+            fixture_store.record(normalize_request(origin, destination, optional_params), directions)
+        return directions
     else:
+        with stats_lock:
+            upstream_stats["errors"] += 1
         return {"error": "Error fetching directions from Google Maps API", "status_code": response.status_code}
 
+def pick(source, *keys):
+    """The given keys of a dict, skipping any that are missing"""
+    return {key: source[key] for key in keys if key in source}
+
+def project_transit_summary(directions):
+    """
+    The Google response cut down to what the journey services read: per route, its legs
+    and their top-level steps with travel mode, distance, duration and locations, and for
+    transit steps the vehicle type, line name and boarding/alighting stops. Keys and
+    nesting match Google's, so consumers of the full response can read this unchanged.
+    Polylines, HTML instructions, walking sub-steps, agencies and icons are dropped.
+    """
+    routes = []
+    for route in directions.get("routes", []):
+        legs = []
+        for leg in route.get("legs", []):
+            steps = []
+            for step in leg.get("steps", []):
+                summary = pick(step, "travel_mode", "distance", "duration", "start_location", "end_location")
+                if "transit_details" in step:
+                    transit = step["transit_details"]
+                    line = transit.get("line", {})
+                    summary["transit_details"] = {
+                        **pick(transit, "departure_stop", "arrival_stop", "num_stops", "headsign"),
+                        "line": {
+                            **pick(line, "name", "short_name"),
+                            "vehicle": pick(line.get("vehicle", {}), "type", "name")
+                        }
+                    }
+                steps.append(summary)
+            legs.append({
+                **pick(leg, "distance", "duration", "departure_time", "arrival_time", "start_location", "end_location"),
+                "steps": steps
+            })
+        routes.append({**pick(route, "summary"), "legs": legs})
+    return {"routes": routes, "status": directions.get("status")}
+
+PROJECTIONS = {
+    "full": lambda directions: directions,
+    "transit_summary": project_transit_summary
+}
+
+# Batch lookups: cache hits are answered inline, and each distinct uncached trip is
+# fetched once on a shared pool, so at most DIRECTIONS_BATCH_CONCURRENCY Google calls
+# run at a time across all batch requests
+DIRECTIONS_BATCH_CONCURRENCY = int(os.environ.get('DIRECTIONS_BATCH_CONCURRENCY', 8))
+DIRECTIONS_BATCH_MAX_PAIRS = int(os.environ.get('DIRECTIONS_BATCH_MAX_PAIRS', 500))
+
+batch_executor = ThreadPoolExecutor(max_workers=DIRECTIONS_BATCH_CONCURRENCY, thread_name_prefix="directions-batch")
+
+def build_optional_params(args):
+    """Google's optional parameters from query args or a batch item, with the endpoint defaults"""
+    mode = args.get('mode', 'transit')  # Default to 'transit'
+    departure_time = args.get('departure_time')
+    avoid = args.get('avoid')
+    alternatives = args.get('alternatives', 'true')  # Default to 'true'
+
+    optional_params = {}
+    if mode:
+        optional_params['mode'] = mode
+    if departure_time:
+        optional_params['departure_time'] = str(departure_time)
+    if avoid:
+        optional_params['avoid'] = avoid
+    
+    # Add alternatives parameter (convert string or boolean to Google Maps API form)
+    if alternatives is not None and alternatives != '':
+        optional_params['alternatives'] = 'true' if str(alternatives).lower() == 'true' else 'false'
+    return optional_params
+
+def get_directions_batch(trips):
+    """
+    Directions for (origin, destination, optional_params) trips, in order.
+    Returns (list of (directions, cache info), summary counters).
+    """
+    keys = [directions_cache_key(origin, destination, params) for origin, destination, params in trips]
+    answers = {}
+    pending = {}
+    for key, (origin, destination, params) in zip(keys, trips):
+        if key in answers or key in pending:
+            continue
+        entry = read_cache(key)
+        if entry is not None:
+            answers[key] = (entry[1], {"status": "hit", "age_seconds": round(time.time() - entry[0], 1)})
+        else:
+            pending[key] = batch_executor.submit(get_directions_cached, origin, destination, **params)
+
+    for key, future in pending.items():
+        # One failing trip (e.g. a 200 with a non-JSON body) must not sink the rest of the batch
+        try:
+            answers[key] = future.result()
+        except Exception as e:
+            print(f"Batch directions lookup failed: {e}")
+            answers[key] = ({"error": f"Error fetching directions: {e}", "status_code": 502},
+                            {"status": "miss", "age_seconds": 0.0})
+
+    results = [answers[key] for key in keys]
+    summary = {
+        "pairs": len(trips),
+        "distinct_trips": len(answers),
+        "cache_hits": len(answers) - len(pending),
+        "upstream_calls": len(pending),
+        "errors": sum(1 for directions, _ in results if "error" in directions)
+    }
+    return results, summary
+
 @app.route("/directions")
 def get_directions():
     """
@@ -112,9 +551,17 @@ def get_directions():
           schema:
             type: string
             default: "true"
+        - name: projection
+          in: query
+          required: false
+          description: full (the Google response as is) or transit_summary (legs and steps with travel mode, distance, vehicle type, line name and stop locations only)
+          schema:
+            type: string
+            enum: ["full", "transit_summary"]
+            default: "full"
     responses:
         200:
-            description: Directions retrieved successfully
+            description: Directions retrieved successfully (cache status in the X-Cache and Age headers)
         400:
             description: Bad request, missing parameters
         500:
@@ -123,35 +570,145 @@ def get_directions():
     # Get query parameters
     origin = request.args.get('origin')
     destination = request.args.get('destination')
-    mode = request.args.get('mode', 'transit')  # Default to 'driving'
-    departure_time = request.args.get('departure_time')
-    avoid = request.args.get('avoid')
-    alternatives = request.args.get('alternatives', 'true')  # Default to 'true'
+    projection = request.args.get('projection', 'full')
 
     if not origin or not destination:
         return jsonify({"error": "Both origin and destination must be provided."}), 400
     
-    # Build optional parameters dictionary
-    optional_params = {}
-    if mode:
-        optional_params['mode'] = mode
-    if departure_time:
-        optional_params['departure_time'] = departure_time
-    if avoid:
-        optional_params['avoid'] = avoid
+    if projection not in PROJECTIONS:
+        return jsonify({"error": f"projection must be one of: {', '.join(PROJECTIONS)}"}), 400
     
-    # Add alternatives parameter (convert string to boolean for Google Maps API)
-    if alternatives:
-        optional_params['alternatives'] = 'true' if alternatives.lower() == 'true' else 'false'
-
+    # Build optional parameters dictionary
+    optional_params = build_optional_params(request.args)
     
-    # Call the function to get directions
-    directions = get_google_maps_directions(origin, destination, **optional_params)
+    # Get directions, from the cache when the same trip was asked for recently
+    directions, cache = get_directions_cached(origin, destination, **optional_params)
     
     if 'error' in directions:
         return jsonify(directions), 500
     
-    return jsonify(directions)
+    # The cache holds full responses; the projection is applied on the way out
+    response = jsonify(PROJECTIONS[projection](directions))
+    response.headers["X-Cache"] = cache["status"].upper()
+    response.headers["Age"] = str(int(cache["age_seconds"]))
+    return response
+
+@app.route("/directions/batch", methods=["POST"])
+def get_directions_batch_route():
+    """
+    Get directions for many origin/destination pairs at once
+    ---
+    tags:
+      - Directions
+    parameters:
+        - name: projection
+          in: query
+          required: false
+          description: full or transit_summary, applied to every result
+          schema:
+            type: string
+            enum: ["full", "transit_summary"]
+            default: "full"
+    requestBody:
+        required: true
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                pairs:
+                  type: array
+                  items:
+                    type: object
+                    required: [origin, destination]
+                    properties:
+                      origin:
+                        type: string
+                      destination:
+                        type: string
+                      mode:
+                        type: string
+                        default: "transit"
+                      departure_time:
+                        type: string
+                      avoid:
+                        type: string
+                      alternatives:
+                        type: string
+                        default: "true"
+    responses:
+        200:
+            description: Directions (or an error) and cache status for each pair, in request order, plus hit/upstream counts
+        400:
+            description: Bad request, missing or too many pairs
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("pairs")
+    projection = request.args.get('projection', data.get('projection', 'full'))
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing pairs array in request body"}), 400
+    if len(items) > DIRECTIONS_BATCH_MAX_PAIRS:
+        return jsonify({"error": f"Too many pairs ({len(items)}), maximum is {DIRECTIONS_BATCH_MAX_PAIRS}"}), 400
+    if projection not in PROJECTIONS:
+        return jsonify({"error": f"projection must be one of: {', '.join(PROJECTIONS)}"}), 400
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("origin") or not item.get("destination"):
+            return jsonify({"error": f"Pair {index} must have both origin and destination."}), 400
+
+    trips = [(str(item["origin"]), str(item["destination"]), build_optional_params(item)) for item in items]
+    answers, summary = get_directions_batch(trips)
+
+    results = []
+    for item, (directions, cache) in zip(items, answers):
+        result = {"origin": item["origin"], "destination": item["destination"], "cache": cache}
+        if "error" in directions:
+            result["error"] = directions
+        else:
+            result["directions"] = PROJECTIONS[projection](directions)
+        results.append(result)
+
+    return jsonify({"results": results, "summary": summary})
+
+@app.route("/directions/stats")
+def get_directions_stats():
+    """
+    Directions cache and upstream counters
+    ---
+    tags:
+      - Directions
+    responses:
+        200:
+            description: Cache hits (in-process and Redis), misses, uncacheable responses, size and evictions; Google call counts, errors and latency histogram
+    """
+    with stats_lock:
+        stats = dict(cache_stats)
+        upstream = dict(upstream_stats)
+    lookups = stats["hit"] + stats["redis_hit"] + stats["miss"]
+    return jsonify({
+        "cache": {
+            **stats,
+            "hit_rate": round((stats["hit"] + stats["redis_hit"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(directions_cache),
+            "max_entries": directions_cache.max_size,
+            "bytes": directions_cache.bytes,
+            "max_bytes": directions_cache.max_bytes,
+            "evictions": directions_cache.evictions,
+            "ttl_seconds": DIRECTIONS_CACHE_TTL,
+            "departure_time_bucket_seconds": DEPARTURE_TIME_BUCKET,
+            "redis_tier": redis_client is not None
+        },
+        "upstream": {
+            **upstream,
+            "mode": DIRECTIONS_MODE,
+            "fixtures": {**fixture_store.stats, "loaded": len(fixture_store)} if fixture_store is not None else None,
+            "latency": upstream_latency.stats(),
+            "pool_size": GOOGLE_POOL_SIZE,
+            "connect_timeout_seconds": GOOGLE_CONNECT_TIMEOUT,
+            "read_timeout_seconds": GOOGLE_READ_TIMEOUT,
+            "max_retries": GOOGLE_MAX_RETRIES
+        }
+    })
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
@@ -17,6 +17,11 @@ selected_route_URL = "http://selected_route:5301/selectedroute"
 # URL for BusTracking microservice
 bus_tracking_URL = "http://bus_tracking:5030/bus-tracking"
 
+# Seconds between bus arrival checks; each check renews the BusTracking prefetch
+# subscription for a few intervals, so it lapses soon after polling stops
+POLL_INTERVAL = 60
+SUBSCRIPTION_TTL = 3 * POLL_INTERVAL
+
 # URL for User microservice
 user_URL = "http://user:5201/users"
 
@@ -232,25 +237,37 @@ def process_notification_request(RouteID):
             print(f"User {user_id} does not have a phone number")
             return
         
-        # 5. Process bus arrival and send notification
+        # 5. Ask BusTracking to keep this stop's arrivals warm while we poll
+        subscription = {
+            "subscriptions": [{"BusStopCode": bus_stop_code, "ServiceNo": bus_id}],
+            "ttl_seconds": SUBSCRIPTION_TTL
+        }
+        
+        # 6. Process bus arrival and send notification
         should_notify = False
         notification_data = None
         
-        while not should_notify:
-            # Process bus arrival information
-            should_notify, notification_data = process_bus_arrival(bus_stop_code, bus_id)
-            
-            # If bus is arriving in less than 2 minutes, publish notification
-            if should_notify and notification_data:
-                # Publish notification with phone number and route name
-                publish_notification(notification_data, phone_number, route_name)
-                print(f"Notification sent!", flush=True)
-                break
-            else:
-                # Wait for 1 minute before checking again
-                print(f"Bus not arriving soon, checking again in 1 minute", flush=True)
-                time.sleep(60) # Wait for 1 minute
-        
+        try:
+            while not should_notify:
+                # Renew the subscription on every check
+                invoke_http(f"{bus_tracking_URL}/subscriptions", method="POST", json=subscription)
+                
+                # Process bus arrival information
+                should_notify, notification_data = process_bus_arrival(bus_stop_code, bus_id)
+                
+                # If bus is arriving in less than 2 minutes, publish notification
+                if should_notify and notification_data:
+                    # Publish notification with phone number and route name
+                    publish_notification(notification_data, phone_number, route_name)
+                    print(f"Notification sent!", flush=True)
+                    break
+                else:
+                    # Wait for 1 minute before checking again
+                    print(f"Bus not arriving soon, checking again in 1 minute", flush=True)
+                    time.sleep(POLL_INTERVAL) # Wait for 1 minute
+        finally:
+            # Unsubscribe even if polling failed
+            invoke_http(f"{bus_tracking_URL}/subscriptions", method="DELETE", json=subscription)
         print(f"Notification process completed for RouteID: {RouteID}")
     except Exception as e:
         print(f"Error processing notification request: {e}")